@@ -0,0 +1,155 @@
+#	recipes - Python-based HTML5 generation for cooking recipes
+#	Copyright (C) 2019-2019 Johannes Bauer
+#
+#	This file is part of recipes.
+#
+#	recipes is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; this program is ONLY licensed under
+#	version 3 of the License, later versions are explicitly excluded.
+#
+#	recipes is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with recipes; if not, write to the Free Software
+#	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#	Johannes Bauer <JohannesBauer@gmx.de>
+
+
+import os
+import json
+import hashlib
+from Tools import Tools
+
+class MetadataDigest():
+	"""Computes a digest over only those metadata entries that a recipe
+	actually refers to. This way, editing an ingredient in the language file
+	only invalidates the recipes that use that ingredient. Unit definitions
+	are global (any quantity may be converted to any unit) and so are the
+	texts of the user interface, so they are part of every digest, as is
+	whether quantities are computed exactly."""
+	def __init__(self, conversion_file, ingredient_file, exact = False):
+		self._exact = exact
+		with open(conversion_file) as f:
+			self._conversion = json.load(f)
+		with open(ingredient_file) as f:
+			self._ingredient = json.load(f)
+
+	def __call__(self, referenced_ids):
+		entries = {
+			"exact":				self._exact,
+			"conversion_units":		self._conversion["units"],
+			"unit_names":			self._ingredient["units"],
+			"strings":				self._ingredient.get("strings"),
+			"conversion":			{ ingredient_id: self._conversion["ingredients"].get(ingredient_id) for ingredient_id in referenced_ids["ingredients"] },
+			"ingredients":			{ ingredient_id: self._ingredient["ingredients"].get(ingredient_id) for ingredient_id in referenced_ids["ingredients"] },
+			"servings":				{ serving_id: self._ingredient["servings"].get(serving_id) for serving_id in referenced_ids["servings"] },
+		}
+		return BuildManifest.hash_data(json.dumps(entries, sort_keys = True).encode("utf-8"))
+
+class BuildManifest():
+	"""Records, for every output file of a site build, the hashes of the
+	inputs it was generated from so that a subsequent build only needs to
+	regenerate outputs whose inputs have changed."""
+	_VERSION = 2
+
+	def __init__(self, filename, content = None):
+		self._filename = filename
+		if (content is None) or (content.get("version") != self._VERSION):
+			content = {
+				"version":	self._VERSION,
+				"pages":	{ },
+				"static":	{ },
+			}
+		self._content = content
+
+	@classmethod
+	def load(cls, filename):
+		try:
+			with open(filename) as f:
+				content = json.load(f)
+		except (FileNotFoundError, json.decoder.JSONDecodeError):
+			content = None
+		return cls(filename, content)
+
+	@staticmethod
+	def hash_data(data):
+		return hashlib.sha256(data).hexdigest()
+
+	@classmethod
+	def hash_file(cls, filename):
+		with open(filename, "rb") as f:
+			return cls.hash_data(f.read())
+
+	@classmethod
+	def hash_directory(cls, dirname):
+		"""Returns a single hash over the names and contents of all files in a
+		directory tree."""
+		hashes = [ ]
+		for (relname, filename) in cls.list_directory(dirname):
+			hashes.append(relname + ":" + cls.hash_file(filename))
+		return cls.hash_data("\n".join(hashes).encode("utf-8"))
+
+	@staticmethod
+	def list_directory(dirname):
+		"""Returns a sorted list of (relative name, full filename) tuples of
+		all files in a directory tree."""
+		result = [ ]
+		for (basedir, subdirs, files) in os.walk(dirname):
+			for filename in files:
+				full_filename = os.path.join(basedir, filename)
+				result.append((os.path.relpath(full_filename, dirname), full_filename))
+		result.sort()
+		return result
+
+	@property
+	def pages(self):
+		return self._content["pages"].keys()
+
+	def page_uptodate(self, name, source_hash, template_hash, lang, metadata_digest):
+		"""Returns True if the page with the given name was previously built
+		from identical inputs. The metadata digest callback is only invoked
+		when all other inputs match."""
+		entry = self._content["pages"].get(name)
+		if entry is None:
+			return False
+		if (entry["source"] != source_hash) or (entry["template"] != template_hash) or (entry["lang"] != lang):
+			return False
+		return entry["meta"] == metadata_digest(entry["ids"])
+
+	def set_page(self, name, source_hash, template_hash, lang, referenced_ids, meta_hash, search_entry):
+		self._content["pages"][name] = {
+			"source":	source_hash,
+			"template":	template_hash,
+			"lang":		lang,
+			"ids":		referenced_ids,
+			"meta":		meta_hash,
+			"search":	search_entry,
+		}
+
+	def get_search_entry(self, name):
+		return self._content["pages"][name]["search"]
+
+	def remove_page(self, name):
+		self._content["pages"].pop(name, None)
+
+	@property
+	def static(self):
+		return self._content["static"].keys()
+
+	def static_uptodate(self, relname, file_hash):
+		return self._content["static"].get(relname) == file_hash
+
+	def set_static(self, relname, file_hash):
+		self._content["static"][relname] = file_hash
+
+	def remove_static(self, relname):
+		self._content["static"].pop(relname, None)
+
+	def write(self):
+		with Tools.atomic_write(self._filename) as f:
+			json.dump(self._content, f, indent = 4, sort_keys = True)
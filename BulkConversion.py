@@ -0,0 +1,131 @@
+#	recipes - Python-based HTML5 generation for cooking recipes
+#	Copyright (C) 2019-2019 Johannes Bauer
+#
+#	This file is part of recipes.
+#
+#	recipes is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; this program is ONLY licensed under
+#	version 3 of the License, later versions are explicitly excluded.
+#
+#	recipes is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with recipes; if not, write to the Free Software
+#	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#	Johannes Bauer <JohannesBauer@gmx.de>
+
+
+import numpy
+
+class ConversionMatrix():
+	"""Dense representation of the per-ingredient conversion tables of the
+	metadata: matrix[ingredient, from unit, to unit] holds the conversion
+	factor, or NaN if no such conversion exists. Pieces use the unit "#"."""
+
+	def __init__(self, metadata, ingredient_ids):
+		self._units = sorted(metadata.mass_units.units) + sorted(metadata.volume_units.units) + [ "#" ]
+		self._unit_index = { unit: index for (index, unit) in enumerate(self._units) }
+		self._ingredient_ids = list(ingredient_ids)
+		self._ingredient_index = { ingredient_id: index for (index, ingredient_id) in enumerate(self._ingredient_ids) }
+		self._matrix = numpy.full((len(self._ingredient_ids), len(self._units), len(self._units)), numpy.nan)
+		for (ingredient_index, ingredient_id) in enumerate(self._ingredient_ids):
+			for ((from_unit, to_unit), factor) in metadata.get_ingredient(ingredient_id).conversions.items():
+				self._matrix[ingredient_index, self._unit_index[from_unit], self._unit_index[to_unit]] = factor
+
+	@property
+	def units(self):
+		return self._units
+
+	@property
+	def matrix(self):
+		return self._matrix
+
+	def get_unit_index(self, unit):
+		"""Returns the index of a unit or -1 if it is not convertible at
+		all. Pieces are given as unit None or "#"."""
+		if unit is None:
+			unit = "#"
+		return self._unit_index.get(unit, -1)
+
+	def get_ingredient_index(self, ingredient_id):
+		return self._ingredient_index[ingredient_id]
+
+class QuantityArray():
+	"""Packs all quantities of a set of recipes into NumPy arrays (quantity,
+	unit index, ingredient index and recipe index, one entry per line item)
+	so that scaling and unit conversion of thousands of line items are array
+	operations."""
+
+	def __init__(self, recipes, metadata):
+		self._recipes = list(recipes)
+		self._items = [ ]
+		recipe_indices = [ ]
+		for (recipe_index, recipe) in enumerate(self._recipes):
+			for ingredient_list in recipe.ingredient_classes:
+				for ingredient in ingredient_list:
+					self._items.append(ingredient)
+					recipe_indices.append(recipe_index)
+
+		ingredient_ids = sorted(set(ingredient.ingredient_id for ingredient in self._items))
+		self._conversion = ConversionMatrix(metadata, ingredient_ids)
+		self._cardinality = numpy.array([ numpy.nan if (ingredient.cardinality is None) else ingredient.cardinality for ingredient in self._items ], dtype = numpy.float64)
+		self._unit_index = numpy.array([ self._conversion.get_unit_index(ingredient.unit_id) for ingredient in self._items ], dtype = numpy.intp)
+		self._ingredient_index = numpy.array([ self._conversion.get_ingredient_index(ingredient.ingredient_id) for ingredient in self._items ], dtype = numpy.intp)
+		self._recipe_index = numpy.array(recipe_indices, dtype = numpy.intp)
+
+	@property
+	def recipes(self):
+		return self._recipes
+
+	@property
+	def items(self):
+		"""The Ingredient objects, in the same order as the array entries."""
+		return self._items
+
+	@property
+	def cardinality(self):
+		return self._cardinality
+
+	@property
+	def recipe_index(self):
+		return self._recipe_index
+
+	def __len__(self):
+		return len(self._items)
+
+	def get_scale_factors(self, servings, serving_id = None):
+		"""Returns per-recipe scale factors so that every recipe serves the
+		given number of servings. Recipes which do not state how much they
+		serve are left unscaled."""
+		factors = numpy.ones(len(self._recipes))
+		for (recipe_index, recipe) in enumerate(self._recipes):
+			count = recipe.get_serving_count(serving_id)
+			if count:
+				factors[recipe_index] = servings / count
+		return factors
+
+	def scale(self, factors):
+		"""Returns all quantities scaled by per-recipe factors (an array with
+		one entry per recipe, or a scalar)."""
+		factors = numpy.asarray(factors, dtype = numpy.float64)
+		if factors.ndim == 0:
+			return self._cardinality * factors
+		return self._cardinality * factors[self._recipe_index]
+
+	def convert(self, unit, cardinality = None):
+		"""Converts all quantities (by default the unscaled ones) to the
+		given unit. Entries that cannot be converted are NaN."""
+		if cardinality is None:
+			cardinality = self._cardinality
+		target_index = self._conversion.get_unit_index(unit)
+		if target_index == -1:
+			return numpy.full(len(self._items), numpy.nan)
+		known = self._unit_index != -1
+		factors = numpy.full(len(self._items), numpy.nan)
+		factors[known] = self._conversion.matrix[self._ingredient_index[known], self._unit_index[known], target_index]
+		return cardinality * factors
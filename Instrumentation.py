@@ -0,0 +1,113 @@
+#	recipes - Python-based HTML5 generation for cooking recipes
+#	Copyright (C) 2019-2019 Johannes Bauer
+#
+#	This file is part of recipes.
+#
+#	recipes is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; this program is ONLY licensed under
+#	version 3 of the License, later versions are explicitly excluded.
+#
+#	recipes is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with recipes; if not, write to the Free Software
+#	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#	Johannes Bauer <JohannesBauer@gmx.de>
+
+
+import sys
+import json
+import time
+import functools
+import collections
+
+class Instrumentation():
+	"""Process-wide collection of timings and counters of the render
+	pipeline. It is disabled by default; instrumented functions then only
+	pay for checking the enabled flag. Every timing record consists of the
+	phase name, a label (usually the file or recipe the phase worked on) and
+	the duration in seconds."""
+	enabled = False
+	_records = [ ]
+	_counters = collections.Counter()
+
+	@classmethod
+	def enable(cls, enabled = True):
+		cls.enabled = enabled
+
+	@classmethod
+	def record(cls, phase, label, duration):
+		cls._records.append((phase, label, duration))
+
+	@classmethod
+	def count(cls, counter, increment = 1):
+		cls._counters[counter] += increment
+
+	@classmethod
+	def timed(cls, phase, label = None):
+		"""Decorator that records the duration of every call of the decorated
+		function while instrumentation is enabled. The label is determined by
+		calling the label function with the arguments of the call."""
+		def decorator(function):
+			@functools.wraps(function)
+			def wrapper(*args, **kwargs):
+				if not cls.enabled:
+					return function(*args, **kwargs)
+				t0 = time.perf_counter()
+				try:
+					return function(*args, **kwargs)
+				finally:
+					cls.record(phase, None if (label is None) else label(*args, **kwargs), time.perf_counter() - t0)
+			return wrapper
+		return decorator
+
+	@classmethod
+	def drain(cls):
+		"""Returns everything recorded so far as a picklable dictionary and
+		resets the collection. Used to collect data from worker processes."""
+		data = {
+			"records":	cls._records,
+			"counters":	dict(cls._counters),
+		}
+		cls._records = [ ]
+		cls._counters = collections.Counter()
+		return data
+
+	@classmethod
+	def merge(cls, data):
+		cls._records += data["records"]
+		cls._counters.update(data["counters"])
+
+	@classmethod
+	def write_jsonlines(cls, f = sys.stderr):
+		for (phase, label, duration) in cls._records:
+			print(json.dumps({ "phase": phase, "label": label, "duration": duration }), file = f)
+		for (counter, value) in sorted(cls._counters.items()):
+			print(json.dumps({ "counter": counter, "value": value }), file = f)
+
+	@classmethod
+	def write_summary(cls, f = sys.stderr):
+		"""Prints a table with count, total, mean and maximum duration per
+		phase and names the label of the slowest call of each phase."""
+		phases = collections.OrderedDict()
+		for (phase, label, duration) in cls._records:
+			phases.setdefault(phase, [ ]).append((duration, label))
+		print("%-24s %6s %11s %11s %11s  %s" % ("phase", "count", "total", "mean", "max", "slowest"), file = f)
+		for (phase, durations) in phases.items():
+			total = sum(duration for (duration, label) in durations)
+			(max_duration, max_label) = max(durations, key = lambda entry: entry[0])
+			print("%-24s %6d %8.3f ms %8.3f ms %8.3f ms  %s" % (phase, len(durations), total * 1000, total / len(durations) * 1000, max_duration * 1000, max_label or ""), file = f)
+		for (counter, value) in sorted(cls._counters.items()):
+			print("%-24s %6d" % (counter, value), file = f)
+
+	@classmethod
+	def write(cls, output_format, f = sys.stderr):
+		if output_format == "json":
+			cls.write_jsonlines(f)
+		else:
+			cls.write_summary(f)
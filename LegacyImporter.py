@@ -0,0 +1,486 @@
+#	recipes - Python-based HTML5 generation for cooking recipes
+#	Copyright (C) 2019-2019 Johannes Bauer
+#
+#	This file is part of recipes.
+#
+#	recipes is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; this program is ONLY licensed under
+#	version 3 of the License, later versions are explicitly excluded.
+#
+#	recipes is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with recipes; if not, write to the Free Software
+#	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#	Johannes Bauer <JohannesBauer@gmx.de>
+
+
+import os
+import re
+import json
+import zipfile
+import collections
+import xml.parsers.expat
+from xml.sax.saxutils import escape, quoteattr
+from SingularPlural import SingularPlural
+from Tools import Tools
+from Quantity import Quantity
+
+class ReverseNameIndex():
+	"""Maps German ingredient and unit names, as they appear in free-form
+	recipe texts, back to the IDs of the metadata. Names are compared case
+	insensitively, and every ingredient is additionally known by its name
+	without parenthesized or numeric qualifiers (e.g. "Ei (groß)" as "Ei",
+	"Quark 20%" as "Quark")."""
+
+	# Common abbreviations and spellings that do not appear in the metadata
+	_UNIT_ALIASES = {
+		"gramm":		"g",
+		"kilogramm":	"kg",
+		"liter":		"l",
+		"el":			"tblsp",
+		"tl":			"teasp",
+		"pck":			"pack",
+		"pkg":			"pack",
+		"päckchen":		"pack",
+		"tassen":		"cup",
+	}
+
+	def __init__(self, conversion_file, ingredient_file):
+		with open(conversion_file) as f:
+			conversion = json.load(f)
+		with open(ingredient_file) as f:
+			language = json.load(f)
+
+		self._units = { }
+		for unit_ids in conversion["units"].values():
+			for unit_id in unit_ids:
+				self._units[unit_id.lower()] = unit_id
+		for (unit_id, name) in language.get("units", { }).items():
+			self._add_names(self._units, unit_id, name)
+		self._units.update(self._UNIT_ALIASES)
+
+		self._ingredients = { }
+		for (ingredient_id, data) in language.get("ingredients", { }).items():
+			self._add_names(self._ingredients, ingredient_id, data["name"])
+		# Unqualified names only where they are unambiguous
+		unqualified = { }
+		for (name, ingredient_id) in self._ingredients.items():
+			unqualified.setdefault(self._unqualified(name), set()).add(ingredient_id)
+		for (name, ingredient_ids) in unqualified.items():
+			if (len(ingredient_ids) == 1) and (name not in self._ingredients):
+				self._ingredients[name] = ingredient_ids.pop()
+
+	@staticmethod
+	def normalize(text):
+		return " ".join(text.lower().split())
+
+	@classmethod
+	def _unqualified(cls, text):
+		text = re.sub(r"\([^)]*\)", " ", text)
+		return cls.normalize(" ".join(word for word in text.split() if not re.search(r"[\d%]", word)))
+
+	def _add_names(self, index, identifier, name):
+		name = SingularPlural(name)
+		for text in (name.singular, name.plural):
+			index.setdefault(self.normalize(text), identifier)
+
+	def lookup_unit(self, text):
+		return self._units.get(self.normalize(text).rstrip("."))
+
+	def lookup_ingredient(self, text):
+		"""Returns the ingredient ID of the given name or None. Parenthesized
+		remarks and anything after a comma are ignored. A name that is not
+		known itself resolves to an ingredient whose name it uniquely
+		abbreviates (e.g. "Kakao" for "Kakaopulver")."""
+		text = re.sub(r"\([^)]*\)", " ", text).split(",")[0]
+		candidates = (self.normalize(text), self._unqualified(text))
+		for candidate in candidates:
+			if candidate in self._ingredients:
+				return self._ingredients[candidate]
+		if len(candidates[1]) >= 4:
+			matches = set(ingredient_id for (name, ingredient_id) in self._ingredients.items() if name.startswith(candidates[1]))
+			if len(matches) == 1:
+				return matches.pop()
+
+class LegacyIngredient(collections.namedtuple("LegacyIngredient", [ "name", "count", "unit", "text" ])):
+	"""An ingredient line of a legacy recipe. Name and unit are metadata IDs
+	if they could be resolved and the original text otherwise."""
+
+class LegacyRecipe():
+	def __init__(self, title):
+		self.title = title
+		self.groups = [ ]
+		self.steps = [ ]
+		self.unresolved_ingredients = [ ]
+		self.unresolved_units = [ ]
+
+	def add_group(self, name):
+		self.groups.append((name, [ ]))
+
+	def add_ingredient(self, ingredient):
+		if len(self.groups) == 0:
+			self.add_group("Zutaten")
+		self.groups[-1][1].append(ingredient)
+
+	def to_xml(self):
+		"""Returns the recipe in the XML schema of the recipe sources."""
+		lines = [ "<?xml version=\"1.0\" encoding=\"utf-8\"?>" ]
+		lines.append("<recipe name=%s lang=\"de\">" % (quoteattr(self.title)))
+		lines.append("\t<ingredients>")
+		for (group_name, ingredients) in self.groups:
+			if len(ingredients) == 0:
+				continue
+			lines.append("\t\t<group name=%s>" % (quoteattr(group_name)))
+			for ingredient in ingredients:
+				attributes = [ "name=%s" % (quoteattr(ingredient.name)) ]
+				if ingredient.count is not None:
+					attributes.append("count=%s" % (quoteattr(ingredient.count)))
+				if ingredient.unit is not None:
+					attributes.append("unit=%s" % (quoteattr(ingredient.unit)))
+				lines.append("\t\t\t<ingredient %s />" % (" ".join(attributes)))
+			lines.append("\t\t</group>")
+		lines.append("\t</ingredients>")
+		lines.append("\t<preparation>")
+		# The recipe schema requires at least one step
+		for step in (self.steps or [ "" ]):
+			lines.append("\t\t<step>")
+			lines.append("\t\t\t%s" % (escape(step)))
+			lines.append("\t\t</step>")
+		lines.append("\t</preparation>")
+		lines.append("</recipe>")
+		return "\n".join(lines) + "\n"
+
+class LegacyRecipeParser():
+	"""Parses the free-form layout of the legacy recipe archives: a title
+	(optionally underlined with "="), ingredient sections introduced by a
+	"Zutaten:"-like header or an underlined group name, ingredient lines of
+	the form "<quantity>[<unit>] [(<remark>)] <name>" and preparation text,
+	either after a "Zubereitung:" header or as bulleted/numbered steps."""
+	_NUMBER = r"(?:\d+(?:[.,]\d+)?(?:\s+\d+\s*/\s*\d+|\s*/\s*\d+)?|[½¼¾]|halbe[rn]?)"
+	_INGREDIENT_RE = re.compile(r"(?P<count>" + _NUMBER + r"(?:\s*-\s*" + _NUMBER + r")?)\s*(?P<unit>[^\W\d]+\.?)?\s*(?P<remark>\([^)]*\))?\s*(?P<name>.*)")
+	_BULLET_RE = re.compile(r"\s*[*•-]\s+")
+	_NUMBERED_RE = re.compile(r"\s*\d+[.)]\s+")
+	_UNDERLINE_RE = re.compile(r"\s*=+\s*")
+	_PREPARATION_HEADERS = ("zubereitung", "anleitung")
+	_NUMBER_WORDS = { "halbe": "1/2", "halber": "1/2", "halben": "1/2" }
+
+	def __init__(self, name_index):
+		self._index = name_index
+
+	@classmethod
+	def _normalize_count(cls, text):
+		"""Converts a quantity to the notation of the count attribute, which
+		accepts everything Quantity.parse() does (decimal commas, ranges,
+		Unicode fractions) except for number words like "halbe"."""
+		text = " ".join(text.split())
+		text = cls._NUMBER_WORDS.get(text.lower(), text)
+		Quantity.parse(text)
+		return text
+
+	def _parse_ingredient(self, text, has_count):
+		match = self._INGREDIENT_RE.fullmatch(text.strip()) if has_count else None
+		(count, unit, name_text) = (None, None, text.strip())
+		if match is not None:
+			(count, name_text) = (self._normalize_count(match["count"]), match["name"])
+			unit_text = match["unit"]
+			if unit_text is not None:
+				unit = self._index.lookup_unit(unit_text)
+				if unit is not None:
+					pass
+				elif (name_text.strip() != "") and (self._index.lookup_ingredient(unit_text + " " + name_text) is None) and (self._index.lookup_ingredient(name_text) is not None):
+					# A unit without metadata ("2 Dosen Mandarinen")
+					self._recipe.unresolved_units.append(unit_text)
+					unit = unit_text
+				else:
+					# Not a unit, but the first word of the name ("1 Ei")
+					name_text = (unit_text + " " + name_text).strip()
+		name_text = re.sub(r"\([^)]*\)", " ", name_text).strip()
+		if name_text == "":
+			return None
+
+		ingredient_id = self._index.lookup_ingredient(name_text)
+		if ingredient_id is None:
+			ingredient_id = " ".join(name_text.split())
+			self._recipe.unresolved_ingredients.append(ingredient_id)
+		return LegacyIngredient(name = ingredient_id, count = count, unit = unit, text = text.strip())
+
+	def _is_count(self, text):
+		match = self._INGREDIENT_RE.match(text.strip())
+		return (match is not None) and (match["count"] != "") and (not text.strip().startswith("-"))
+
+	def _header(self, line):
+		"""Returns the header name if the line is a section header like
+		"Zutaten:" or "Belag:" and None otherwise."""
+		stripped = line.strip()
+		if stripped.endswith(":") and (len(stripped.split()) <= 6) and (not self._is_count(stripped)):
+			return stripped[:-1].strip()
+
+	def _begin_section(self, name):
+		lower_name = name.lower()
+		if lower_name.startswith(self._PREPARATION_HEADERS):
+			self._mode = "preparation"
+			return
+		self._mode = "ingredients"
+		if lower_name.startswith("zutaten"):
+			match = re.fullmatch(r"zutaten\s+für\s+(.*)", name, flags = re.IGNORECASE)
+			name = match.group(1) if match else "Zutaten"
+		self._recipe.add_group(name)
+
+	def _add_step(self, text, continuation = False):
+		if not continuation:
+			# Bullets and step numbers ("1.", "2)") are not part of the text
+			marker = self._BULLET_RE.match(text) or self._NUMBERED_RE.match(text)
+			if marker is not None:
+				text = text[marker.end():]
+		text = " ".join(text.split())
+		if text == "":
+			return
+		if continuation and (len(self._recipe.steps) > 0):
+			self._recipe.steps[-1] += " " + text
+		else:
+			self._recipe.steps.append(text)
+
+	def parse(self, lines, default_title):
+		"""Parses the lines of one legacy recipe document."""
+		lines = [ line.rstrip() for line in lines ]
+		self._recipe = LegacyRecipe(default_title)
+		self._mode = None
+		title_found = False
+		last_was_step = False
+		for (lineno, line) in enumerate(lines):
+			next_line = lines[lineno + 1] if (lineno + 1 < len(lines)) else ""
+			if (line.strip() == "") or self._UNDERLINE_RE.fullmatch(line):
+				last_was_step = False
+				continue
+
+			underlined = (self._UNDERLINE_RE.fullmatch(next_line) is not None)
+			if not title_found:
+				title_found = True
+				if underlined or ((self._header(line) is None) and (not self._is_count(line))):
+					self._recipe.title = line.strip()
+					continue
+			if underlined:
+				self._begin_section(line.strip())
+				last_was_step = False
+				continue
+			header = self._header(line)
+			if header is not None:
+				self._begin_section(header)
+				last_was_step = False
+				continue
+
+			if self._mode == "preparation":
+				self._add_step(line, continuation = last_was_step and line[:1].isspace())
+				last_was_step = True
+				continue
+
+			bullet = self._BULLET_RE.match(line)
+			text = line[bullet.end():] if bullet else line
+			if self._NUMBERED_RE.match(line):
+				self._add_step(line)
+				last_was_step = True
+			elif self._is_count(text):
+				ingredient = self._parse_ingredient(text, has_count = True)
+				if ingredient is not None:
+					self._recipe.add_ingredient(ingredient)
+				last_was_step = False
+			elif (bullet is None) and (len(text.split()) <= 3) and re.search(r"[^\W\d]", text) and (not text.strip().endswith(".")) and (not (last_was_step and line[:1].isspace())):
+				# A short line without quantity, e.g. "Pfeffer"
+				ingredient = self._parse_ingredient(text, has_count = False)
+				if ingredient is not None:
+					self._recipe.add_ingredient(ingredient)
+				last_was_step = False
+			else:
+				self._add_step(text, continuation = (bullet is None) and last_was_step and line[:1].isspace())
+				last_was_step = True
+		return self._recipe
+
+class _OdtTextExtractor():
+	"""Streams the text of an OpenDocument text file as lines: one line per
+	paragraph or heading and one tab-separated line per table row."""
+	_PARAGRAPHS = ("text:p", "text:h")
+
+	def __init__(self):
+		self._lines = [ ]
+		self._text = [ ]
+		self._cells = None
+		self._depth = 0
+		self._parser = xml.parsers.expat.ParserCreate()
+		self._parser.StartElementHandler = self._start_element
+		self._parser.EndElementHandler = self._end_element
+		self._parser.CharacterDataHandler = self._cdata
+
+	def _start_element(self, name, attrs):
+		if name in self._PARAGRAPHS:
+			self._depth += 1
+		elif name == "table:table-row":
+			self._cells = [ ]
+		elif name == "text:tab":
+			self._text.append("\t")
+		elif name == "text:s":
+			self._text.append(" " * int(attrs.get("text:c", "1")))
+		elif name == "text:line-break":
+			self._text.append("\n")
+
+	def _end_element(self, name):
+		if name in self._PARAGRAPHS:
+			self._depth -= 1
+			if self._depth == 0:
+				text = "".join(self._text)
+				self._text = [ ]
+				if self._cells is not None:
+					self._cells.append(text.strip())
+				else:
+					self._lines += text.split("\n")
+		elif name == "table:table-row":
+			self._lines.append("\t".join(self._cells))
+			self._cells = None
+
+	def _cdata(self, text):
+		if self._depth > 0:
+			self._text.append(text)
+
+	def extract(self, filename):
+		with zipfile.ZipFile(filename) as odt:
+			with odt.open("content.xml") as f:
+				self._parser.ParseFile(f)
+		return self._lines
+
+class LegacyImporter():
+	"""Converts legacy plain text (.txt) and OpenDocument (.odt) recipes to
+	recipe XML files, one document at a time, and collects the ingredient
+	and unit names that could not be resolved as well as the files that
+	could not be converted at all."""
+	_REPORT_FILES = 5
+	# Errors of a single damaged or unreadable input file (KeyError is
+	# raised for an .odt without content.xml)
+	_FILE_ERRORS = (zipfile.BadZipFile, KeyError, xml.parsers.expat.ExpatError, OSError, ValueError)
+
+	def __init__(self, conversion_file, ingredient_file):
+		self._parser = LegacyRecipeParser(ReverseNameIndex(conversion_file, ingredient_file))
+		# Unresolved name -> names of the files it occurs in
+		self._unresolved_ingredients = collections.OrderedDict()
+		self._unresolved_units = collections.OrderedDict()
+		# Filename -> error message
+		self._failures = collections.OrderedDict()
+
+	@staticmethod
+	def source_files(paths):
+		"""Yields all importable files of the given files and directories."""
+		for path in paths:
+			if os.path.isdir(path):
+				for filename in sorted(os.listdir(path)):
+					if filename.lower().endswith((".txt", ".odt")):
+						yield os.path.join(path, filename)
+			else:
+				yield path
+
+	@staticmethod
+	def read_lines(filename):
+		if filename.lower().endswith(".odt"):
+			return _OdtTextExtractor().extract(filename)
+		with open(filename, encoding = "utf-8", errors = "replace") as f:
+			return f.read().split("\n")
+
+	@staticmethod
+	def output_name(filename):
+		"""Returns the name of the recipe XML file for a legacy file, e.g.
+		"käsekuchen" for "Käsekuchen.txt"."""
+		name = os.path.splitext(os.path.basename(filename))[0].lower()
+		return re.sub(r"[^\w]+", "_", name).strip("_")
+
+	def convert(self, filename):
+		name = os.path.splitext(os.path.basename(filename))[0]
+		recipe = self._parser.parse(self.read_lines(filename), default_title = name)
+		for ingredient_name in recipe.unresolved_ingredients:
+			self._unresolved_ingredients.setdefault(ingredient_name, [ ]).append(filename)
+		for unit_name in recipe.unresolved_units:
+			self._unresolved_units.setdefault(unit_name, [ ]).append(filename)
+		return recipe
+
+	def import_files(self, paths, output_dir, force = False):
+		"""Converts all given files and writes the recipe XML files to the
+		output directory. Yields a tuple of input filename, output filename
+		(None if the output file already existed) and the parsed recipe for
+		every file that could be converted. Files that cannot be read or
+		parsed are skipped and listed in the failures."""
+		os.makedirs(output_dir, exist_ok = True)
+		for filename in self.source_files(paths):
+			output_filename = output_dir + "/" + self.output_name(filename) + ".xml"
+			try:
+				recipe = self.convert(filename)
+				if (not force) and os.path.exists(output_filename):
+					output_filename = None
+				else:
+					with Tools.atomic_write(output_filename) as f:
+						f.write(recipe.to_xml())
+			except self._FILE_ERRORS as e:
+				self._failures[filename] = "%s: %s" % (e.__class__.__name__, e)
+				continue
+			yield (filename, output_filename, recipe)
+
+	@property
+	def unresolved_ingredients(self):
+		"""Ingredient names without metadata entry, with the files they
+		occur in."""
+		return self._unresolved_ingredients
+
+	@property
+	def unresolved_units(self):
+		return self._unresolved_units
+
+	@property
+	def failures(self):
+		"""Files that could not be converted, with the error message."""
+		return self._failures
+
+	def write_report(self, f):
+		if len(self._failures) > 0:
+			print("%d file(s) could not be converted:" % (len(self._failures)), file = f)
+			for (filename, message) in self._failures.items():
+				print("    %-40s %s" % (filename, message), file = f)
+		for (description, unresolved) in (("ingredient", self._unresolved_ingredients), ("unit", self._unresolved_units)):
+			print("%d unresolved %s name(s):" % (len(unresolved), description), file = f)
+			for (name, filenames) in sorted(unresolved.items(), key = lambda item: (-len(item[1]), item[0])):
+				basenames = sorted(set(os.path.basename(filename) for filename in filenames))
+				if len(basenames) > self._REPORT_FILES:
+					basenames = basenames[:self._REPORT_FILES] + [ "and %d more" % (len(basenames) - self._REPORT_FILES) ]
+				print("    %-40s %5d x  %s" % (name, len(filenames), ", ".join(basenames)), file = f)
+
+if __name__ == "__main__":
+	import io
+	import tempfile
+
+	def testcase_bad_files():
+		with tempfile.TemporaryDirectory() as tmpdir:
+			source_dir = tmpdir + "/source"
+			os.mkdir(source_dir)
+			with open(source_dir + "/Good.txt", "w") as f:
+				f.write("Kuchen\n======\n\nZutaten:\n200 g Mehl\n2 Eier\n\nZubereitung:\n1. Mehl sieben.\n2) Eier unterrühren.\n")
+			with open(source_dir + "/Corrupt.odt", "wb") as f:
+				f.write(b"this is not a zip file")
+			with zipfile.ZipFile(source_dir + "/Malformed.odt", "w") as odt:
+				odt.writestr("content.xml", "<office:document-content><text:p>Kuchen</text:p>")
+			with zipfile.ZipFile(source_dir + "/Empty.odt", "w") as odt:
+				odt.writestr("mimetype", "application/vnd.oasis.opendocument.text")
+			with open(source_dir + "/Zero.txt", "w") as f:
+				f.write("Kuchen\n\nZutaten:\n1/0 g Mehl\n")
+
+			importer = LegacyImporter(conversion_file = "meta/conversion.json", ingredient_file = "meta/de.json")
+			results = list(importer.import_files([ source_dir, tmpdir + "/missing.txt" ], tmpdir + "/output"))
+			assert([ os.path.basename(filename) for (filename, output_filename, recipe) in results ] == [ "Good.txt" ])
+			assert(sorted(os.listdir(tmpdir + "/output")) == [ "good.xml" ])
+			assert(results[0][2].steps == [ "Mehl sieben.", "Eier unterrühren." ])
+			assert(sorted(os.path.basename(filename) for filename in importer.failures) == [ "Corrupt.odt", "Empty.odt", "Malformed.odt", "Zero.txt", "missing.txt" ])
+
+			report = io.StringIO()
+			importer.write_report(report)
+			assert(report.getvalue().startswith("5 file(s) could not be converted:"))
+
+	testcase_bad_files()
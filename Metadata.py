@@ -19,18 +19,138 @@
 #
 #	Johannes Bauer <JohannesBauer@gmx.de>
 
+
+import os
 import json
+import pickle
+import collections
 from SingularPlural import SingularPlural
 from UnitConversion import UnitConversion
+from Quantity import Quantity
+from Instrumentation import Instrumentation
+from Tools import Tools
+
+IngredientRecord = collections.namedtuple("IngredientRecord", [ "name", "density_g_per_l", "grams_per_unit", "preferred_unit", "sold", "conversions" ])
 
 class Metadata():
-	def __init__(self, conversion_file, ingredient_file):
+	"""Holds conversion and language metadata. Both JSON files are compiled
+	at load time into resolved per-ingredient records and name dictionaries,
+	so that lookups during rendering are single dictionary accesses that
+	return shared objects. In exact mode, all conversion factors are
+	Fractions and recipe quantities are loaded as Fractions as well, so that
+	scaling and summing them does not accumulate rounding errors."""
+
+	_CACHE_VERSION = 4
+
+	def __init__(self, conversion_file, ingredient_file, exact = False):
+		self._exact = exact
 		with open(conversion_file) as f:
-			self._conversion = json.load(f)
+			conversion = json.load(f)
 		with open(ingredient_file) as f:
-			self._ingredient = json.load(f)
-		self._mass_units = UnitConversion(self._conversion["units"]["mass"])
-		self._volume_units = UnitConversion(self._conversion["units"]["volume"])
+			ingredient = json.load(f)
+		self._mass_units = UnitConversion(conversion["units"]["mass"], exact = exact)
+		self._volume_units = UnitConversion(conversion["units"]["volume"], exact = exact)
+		self._generic_conversions = self._compile_conversions(density_g_per_l = None, grams_per_unit = None)
+		self._ingredients = self._compile_ingredients(conversion["ingredients"], ingredient["ingredients"])
+		self._unit_names = { unit_id: SingularPlural(name) for (unit_id, name) in ingredient["units"].items() }
+		self._serving_names = { serving_id: SingularPlural(name) for (serving_id, name) in ingredient["servings"].items() }
+		self._strings = ingredient.get("strings", { })
+
+	def _compile_conversions(self, density_g_per_l, grams_per_unit):
+		"""Returns a dictionary that maps all possible (from unit, to unit)
+		tuples of an ingredient to the factor that converts between them.
+		Unitary quantities (i.e., pieces) have the unit "#". Mass and volume
+		are bridged by the density, pieces and mass by the weight per
+		unit."""
+		conversions = { }
+		for from_unit in self._mass_units.units:
+			for to_unit in self._mass_units.units:
+				conversions[(from_unit, to_unit)] = self._mass_units.factor(from_unit, to_unit)
+		for from_unit in self._volume_units.units:
+			for to_unit in self._volume_units.units:
+				conversions[(from_unit, to_unit)] = self._volume_units.factor(from_unit, to_unit)
+		conversions[("#", "#")] = 1
+
+		if density_g_per_l is not None:
+			for volume_unit in self._volume_units.units:
+				liters_per_unit = self._volume_units.factor(volume_unit, "l")
+				for mass_unit in self._mass_units.units:
+					grams_per_mass_unit = self._mass_units.factor(mass_unit, "g")
+					conversions[(volume_unit, mass_unit)] = liters_per_unit * density_g_per_l * self._mass_units.factor("g", mass_unit)
+					conversions[(mass_unit, volume_unit)] = grams_per_mass_unit / density_g_per_l * self._volume_units.factor("l", volume_unit)
+
+		if grams_per_unit is not None:
+			for mass_unit in self._mass_units.units:
+				conversions[("#", mass_unit)] = grams_per_unit * self._mass_units.factor("g", mass_unit)
+				conversions[(mass_unit, "#")] = self._mass_units.factor(mass_unit, "g") / grams_per_unit
+		return conversions
+
+	def _compile_ingredients(self, conversion_ingredients, language_ingredients):
+		ingredients = { }
+		for ingredient_id in conversion_ingredients.keys() | language_ingredients.keys():
+			conversion = conversion_ingredients.get(ingredient_id, { })
+			language = language_ingredients.get(ingredient_id, { })
+			density_g_per_l = conversion.get("density_g_per_l")
+			grams_per_unit = conversion.get("unit_weight_grams")
+			if self._exact:
+				density_g_per_l = Quantity.rational(density_g_per_l)
+				grams_per_unit = Quantity.rational(grams_per_unit)
+			if (density_g_per_l is None) and (grams_per_unit is None):
+				conversions = self._generic_conversions
+			else:
+				conversions = self._compile_conversions(density_g_per_l, grams_per_unit)
+			ingredients[ingredient_id] = IngredientRecord(
+				name = SingularPlural(language.get("name", ingredient_id)),
+				density_g_per_l = density_g_per_l,
+				grams_per_unit = grams_per_unit,
+				preferred_unit = language.get("prefer"),
+				sold = language.get("sold"),
+				conversions = conversions,
+			)
+		return ingredients
+
+	@staticmethod
+	def _cache_key(conversion_file, ingredient_file, exact):
+		key = [ Metadata._CACHE_VERSION, exact ]
+		for filename in [ conversion_file, ingredient_file ]:
+			stat = os.stat(filename)
+			key.append((os.path.abspath(filename), stat.st_mtime_ns, stat.st_size))
+		return key
+
+	@classmethod
+	@Instrumentation.timed("metadata.load", label = lambda cls, conversion_file, ingredient_file, cache_filename = None, exact = False: ingredient_file)
+	def load(cls, conversion_file, ingredient_file, cache_filename = None, exact = False):
+		"""Loads metadata. If a cache filename is given, the compiled form is
+		read from that cache as long as both source files have unchanged
+		modification times and sizes; otherwise, it is compiled from the JSON
+		files and the cache is rewritten."""
+		if cache_filename is None:
+			return cls(conversion_file, ingredient_file, exact = exact)
+
+		key = cls._cache_key(conversion_file, ingredient_file, exact)
+		try:
+			with open(cache_filename, "rb") as f:
+				(cached_key, metadata) = pickle.load(f)
+			if cached_key == key:
+				return metadata
+		except Exception:
+			# Missing, corrupt or outdated cache file, just recreate it
+			pass
+
+		metadata = cls(conversion_file, ingredient_file, exact = exact)
+		try:
+			os.makedirs(os.path.dirname(os.path.abspath(cache_filename)), exist_ok = True)
+			with Tools.atomic_write(cache_filename, binary = True) as f:
+				pickle.dump((key, metadata), f, protocol = pickle.HIGHEST_PROTOCOL)
+		except (OSError, pickle.PicklingError):
+			# The cache is optional, e.g. a read-only cache directory only
+			# means that the metadata is compiled on every run
+			pass
+		return metadata
+
+	@property
+	def exact(self):
+		return self._exact
 
 	@property
 	def mass_units(self):
@@ -40,26 +160,51 @@ class Metadata():
 	def volume_units(self):
 		return self._volume_units
 
+	def get_ingredient(self, ingredient_id):
+		"""Returns the compiled record of an ingredient. Ingredients which have
+		no metadata at all get a record that is named after their ID."""
+		record = self._ingredients.get(ingredient_id)
+		if record is None:
+			record = IngredientRecord(name = SingularPlural(ingredient_id), density_g_per_l = None, grams_per_unit = None, preferred_unit = None, sold = None, conversions = self._generic_conversions)
+			self._ingredients[ingredient_id] = record
+		return record
+
 	def getingredientname(self, cid):
-		ingredient = self._ingredient["ingredients"].get(cid)
-		if ingredient is None:
-			return SingularPlural(cid)
-		return SingularPlural(ingredient["name"])
+		return self.get_ingredient(cid).name
 
 	def getunitname(self, unit_id):
 		if unit_id is None:
 			return None
-		else:
-			return SingularPlural(self._ingredient["units"].get(unit_id, unit_id))
+		name = self._unit_names.get(unit_id)
+		if name is None:
+			name = SingularPlural(unit_id)
+			self._unit_names[unit_id] = name
+		return name
 
 	def getservingname(self, serving_id):
-		return SingularPlural(self._ingredient["servings"].get(serving_id, serving_id))
+		name = self._serving_names.get(serving_id)
+		if name is None:
+			name = SingularPlural(serving_id)
+			self._serving_names[serving_id] = name
+		return name
+
+	def getstring(self, string_id):
+		"""Returns a text of the user interface (e.g., headings) in the
+		language of the metadata, or the string ID if it is not
+		translated."""
+		return self._strings.get(string_id, string_id)
 
 	def get_density_of(self, ingredient_id):
-		return self._conversion["ingredients"].get(ingredient_id, { }).get("density_g_per_l")
+		return self.get_ingredient(ingredient_id).density_g_per_l
 
 	def get_grams_per_unit_of(self, ingredient_id):
-		return self._conversion["ingredients"].get(ingredient_id, { }).get("unit_weight_grams")
+		return self.get_ingredient(ingredient_id).grams_per_unit
+
+	def get_conversion_factor(self, ingredient_id, from_unit, to_unit):
+		"""Returns the factor that converts a quantity of the given ingredient
+		from one unit to another (use "#" for pieces) or None if no such
+		conversion is possible."""
+		return self.get_ingredient(ingredient_id).conversions.get((from_unit, to_unit))
 
 	def get_preferred_unit_of(self, ingredient_id):
-		return self._ingredient["ingredients"].get(ingredient_id, { }).get("prefer")
+		return self.get_ingredient(ingredient_id).preferred_unit
@@ -0,0 +1,61 @@
+#	recipes - Python-based HTML5 generation for cooking recipes
+#	Copyright (C) 2019-2019 Johannes Bauer
+#
+#	This file is part of recipes.
+#
+#	recipes is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; this program is ONLY licensed under
+#	version 3 of the License, later versions are explicitly excluded.
+#
+#	recipes is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with recipes; if not, write to the Free Software
+#	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#	Johannes Bauer <JohannesBauer@gmx.de>
+
+
+import sys
+import time
+import contextlib
+
+class PhaseTimer():
+	"""Records the wall clock time of named phases of a program run. When
+	disabled, entering a phase does nothing but yield."""
+
+	def __init__(self, enabled = True):
+		self._enabled = enabled
+		self._phases = [ ]
+		self._t0 = time.perf_counter()
+
+	@property
+	def enabled(self):
+		return self._enabled
+
+	@property
+	def phases(self):
+		return iter(self._phases)
+
+	@contextlib.contextmanager
+	def phase(self, name):
+		if not self._enabled:
+			yield
+			return
+		t0 = time.perf_counter()
+		try:
+			yield
+		finally:
+			self._phases.append((name, time.perf_counter() - t0))
+
+	def print_summary(self, file = sys.stderr):
+		total = time.perf_counter() - self._t0
+		for (name, duration) in self._phases:
+			print("%-24s %9.3f ms %5.1f%%" % (name, duration * 1000, duration / total * 100), file = file)
+		unaccounted = total - sum(duration for (name, duration) in self._phases)
+		print("%-24s %9.3f ms %5.1f%%" % ("(other)", unaccounted * 1000, unaccounted / total * 100), file = file)
+		print("%-24s %9.3f ms" % ("total", total * 1000), file = file)
@@ -0,0 +1,235 @@
+#	recipes - Python-based HTML5 generation for cooking recipes
+#	Copyright (C) 2019-2019 Johannes Bauer
+#
+#	This file is part of recipes.
+#
+#	recipes is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; this program is ONLY licensed under
+#	version 3 of the License, later versions are explicitly excluded.
+#
+#	recipes is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with recipes; if not, write to the Free Software
+#	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#	Johannes Bauer <JohannesBauer@gmx.de>
+
+
+import re
+import math
+import fractions
+
+class Quantity():
+	"""A parsed, immutable quantity. 'value' is the quantity as a float and
+	'exact' the same as a Fraction; for a range like "2-3" they are the lower
+	bound and 'high' is the upper bound (None otherwise). Bounds are kept as
+	the arguments of their Fraction (a pair of numerator and denominator or
+	the decimal text), so that Fractions are only created for quantities
+	whose exact value is actually used."""
+	__slots__ = ( "_low", "_high", "_exact", "_value" )
+
+	# Parsed quantities by text; once full, further texts are not cached
+	_CACHE_SIZE = 4096
+	_cache = { }
+
+	_UNICODE_FRACTIONS = {
+		"¼":	(1, 4),
+		"½":	(1, 2),
+		"¾":	(3, 4),
+		"⅓":	(1, 3),
+		"⅔":	(2, 3),
+		"⅛":	(1, 8),
+	}
+
+	# One number: a Unicode fraction ("½") or an integer, optionally
+	# followed by decimals after a point or comma ("1.5", "1,5"), by a
+	# denominator ("1/2"), by a Unicode fraction ("1½", "1 ½") or by a simple
+	# fraction ("1 1/2"). The leading integer is shared by all forms so that
+	# the expression does not need to backtrack. Each number has seven
+	# groups, see _number().
+	_NUMBER = r"""(?:
+		([¼½¾⅓⅔⅛])
+		| (\d+)(?:
+			[.,](\d+)
+			| \s*/\s*(\d+)
+			| \s*([¼½¾⅓⅔⅛])
+			| \s+(\d+)\s*/\s*(\d+)
+		)?
+	)"""
+	_QUANTITY_RE = re.compile(r"\s*" + _NUMBER + r"(?:\s*[-–]\s*" + _NUMBER + r")?\s*", flags = re.VERBOSE)
+
+	def __init__(self, value, low, high = None):
+		# The exact value is only stored once it has been asked for
+		self._value = value
+		self._low = low
+		self._high = high
+
+	@property
+	def value(self):
+		return self._value
+
+	@property
+	def exact(self):
+		try:
+			return self._exact
+		except AttributeError:
+			self._exact = fractions.Fraction(*self._low)
+			return self._exact
+
+	@property
+	def high(self):
+		if self._high is not None:
+			return fractions.Fraction(*self._high)
+
+	@property
+	def is_range(self):
+		return self._high is not None
+
+	def __float__(self):
+		return self._value
+
+	def __repr__(self):
+		return "Quantity(%s%s)" % (self.exact, "" if (self._high is None) else " - %s" % (self.high))
+
+	@staticmethod
+	def rational(number):
+		"""Returns a number from metadata as the Fraction of its decimal
+		notation, i.e. 0.1 becomes exactly 1/10 rather than the nearest binary
+		float."""
+		if number is None:
+			return None
+		return fractions.Fraction(str(number))
+
+	@classmethod
+	def _number(cls, unicode, integer, decimals, denominator, integer_unicode, numerator, mixed_denominator):
+		"""Returns the (numerator, denominator) pair of one number from the
+		groups that _NUMBER matched, or None if it did not match."""
+		if integer is None:
+			if unicode is None:
+				return None
+			return cls._UNICODE_FRACTIONS[unicode]
+
+		integer = int(integer)
+		if decimals is not None:
+			return (integer * (10 ** len(decimals)) + int(decimals), 10 ** len(decimals))
+		elif denominator is not None:
+			denominator = int(denominator)
+		elif integer_unicode is not None:
+			(numerator, denominator) = cls._UNICODE_FRACTIONS[integer_unicode]
+			return (integer * denominator + numerator, denominator)
+		elif numerator is not None:
+			denominator = int(mixed_denominator)
+			integer = integer * denominator + int(numerator)
+		else:
+			return (integer, 1)
+		if denominator == 0:
+			raise ValueError("Denominator is zero.")
+		return (integer, denominator)
+
+	@classmethod
+	def parse(cls, text):
+		"""Parses a quantity. Besides the number forms of _NUMBER, ranges of
+		two numbers ("2-3") are accepted. Anything else that Python understands
+		as a finite number (e.g. "1e3", ".5") is accepted as well. Raises
+		ValueError if the text is not a quantity. Results are cached on the
+		raw text since the same counts recur throughout a corpus; quantities
+		are immutable, so they can be shared."""
+		quantity = cls._cache.get(text)
+		if quantity is None:
+			quantity = cls._parse_uncached(text)
+			if len(cls._cache) < cls._CACHE_SIZE:
+				cls._cache[text] = quantity
+		return quantity
+
+	@classmethod
+	def clear_cache(cls):
+		cls._cache.clear()
+
+	@classmethod
+	def _parse_uncached(cls, text):
+		"""The common forms are parsed with plain string operations, only the
+		others need the regular expression."""
+		if text.isdecimal():
+			# Plain integers are by far the most common counts
+			return cls(float(text), (text, ))
+		if "/" in text:
+			# Simple ("1/2") and mixed ("1 1/2") fractions
+			(numerator, _, denominator) = text.partition("/")
+			numerator = numerator.split()
+			denominator = denominator.strip()
+			if denominator.isdecimal() and (1 <= len(numerator) <= 2) and numerator[0].isdecimal() and numerator[-1].isdecimal():
+				denominator = int(denominator)
+				if denominator != 0:
+					numerator = int(numerator[0]) if (len(numerator) == 1) else (int(numerator[0]) * denominator + int(numerator[1]))
+					return cls(numerator / denominator, (numerator, denominator))
+		else:
+			# Decimals with a point or comma ("2.5", "1,5")
+			decimal = text.replace(",", ".")
+			try:
+				value = float(decimal)
+			except ValueError:
+				value = None
+			# Fraction only accepts underscores in numbers from Python 3.11 on
+			if (value is not None) and math.isfinite(value) and ("_" not in decimal):
+				return cls(value, (decimal, ))
+		match = cls._QUANTITY_RE.fullmatch(text)
+		try:
+			if match is None:
+				exact = fractions.Fraction(text.strip())
+				return cls(float(exact), (exact.numerator, exact.denominator))
+			groups = match.groups()
+			low = cls._number(*groups[:7])
+			return cls(low[0] / low[1], low, cls._number(*groups[7:]) if (match.lastindex > 7) else None)
+		except (ValueError, ZeroDivisionError):
+			raise ValueError("Not a quantity: %s" % (text))
+
+if __name__ == "__main__":
+	def testcase_forms():
+		expect = {
+			"3":		(3, None),
+			" 12 ":		(12, None),
+			"2.5":		(fractions.Fraction(5, 2), None),
+			"1,5":		(fractions.Fraction(3, 2), None),
+			".5":		(fractions.Fraction(1, 2), None),
+			"1e3":		(1000, None),
+			"0.1":		(fractions.Fraction(1, 10), None),
+			"1/3":		(fractions.Fraction(1, 3), None),
+			"1 1/2":	(fractions.Fraction(3, 2), None),
+			"½":		(fractions.Fraction(1, 2), None),
+			"1½":		(fractions.Fraction(3, 2), None),
+			"2-3":		(2, 3),
+			"1,5 – 2":	(fractions.Fraction(3, 2), 2),
+		}
+		for (text, (low, high)) in expect.items():
+			quantity = Quantity.parse(text)
+			assert(quantity.exact == low)
+			assert(quantity.value == float(low))
+			assert(quantity.high == high)
+			assert(quantity.is_range == (high is not None))
+
+	def testcase_invalid():
+		# Infinity and NaN are not quantities, unlike for float()
+		for text in [ "", "abc", "1/0", "1 1/0", "2-", "inf", "-inf", "nan", "Infinity" ]:
+			try:
+				Quantity.parse(text)
+				assert(False)
+			except ValueError:
+				pass
+
+	def testcase_immutable():
+		quantity = Quantity.parse("2.5")
+		try:
+			quantity.value = 5
+			assert(False)
+		except AttributeError:
+			pass
+		assert(Quantity.parse("2.5").value == 2.5)
+
+	testcase_forms()
+	testcase_invalid()
+	testcase_immutable()
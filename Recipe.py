@@ -19,30 +19,34 @@
 #
 #	Johannes Bauer <JohannesBauer@gmx.de>
 
-import collections
-from XMLParser import XMLParser
-from Tools import Tools
+from XMLParser import XMLParser, XMLNode
+from Quantity import Quantity
+from Instrumentation import Instrumentation
 
 class Ingredient():
 	def __init__(self, ingredient_id, cardinality, unit_id, metadata, original_cardinality = None):
 		self._ingredient_id = ingredient_id
 		self._cardinality = cardinality
-		if (original_cardinality is None) and (cardinality is not None):
-			original_cardinality = "%.2f" % (cardinality)
 		self._original_cardinality = original_cardinality
 		self._unit_id = unit_id
 		self._meta = metadata
+		self._converted = None
 
 	@classmethod
 	def from_xmlnode(cls, node, metadata):
-		ingredient_id = node.get("name")
-		if node.get("count") is not None:
-			original_cardinality = node["count"]
-			cardinality = Tools.str2float(node["count"])
+		return cls.from_attributes(node.getattrs(), metadata)
+
+	@classmethod
+	def from_attributes(cls, attrs, metadata):
+		ingredient_id = attrs.get("name")
+		if attrs.get("count") is not None:
+			original_cardinality = attrs["count"]
+			quantity = Quantity.parse(attrs["count"])
+			cardinality = quantity.exact if metadata.exact else quantity.value
 		else:
 			original_cardinality = None
 			cardinality = None
-		unit_id = node.get("unit")
+		unit_id = attrs.get("unit")
 		return cls(ingredient_id = ingredient_id, cardinality = cardinality, unit_id = unit_id, metadata = metadata, original_cardinality = original_cardinality)
 
 	def _create_converted_to(self, new_cardinality, new_unit_id):
@@ -54,6 +58,10 @@ class Ingredient():
 
 	@property
 	def original_cardinality(self):
+		"""The quantity as written in the recipe or, for converted
+		ingredients, formatted from the cardinality."""
+		if (self._original_cardinality is None) and (self._cardinality is not None):
+			return "%.2f" % (self._cardinality)
 		return self._original_cardinality
 
 	@property
@@ -84,55 +92,39 @@ class Ingredient():
 	def is_volume(self):
 		return self._meta.volume_units.is_known(self.unit_id)
 
-	def _get_as_mass(self, unit = "g"):
-		if self.is_unitary:
-			# Check if there's a unitary lookup
-			grams_per_unit = self._meta.get_grams_per_unit_of(self.ingredient_id)
-			if grams_per_unit is not None:
-				return self._create_converted_to(self._meta.mass_units(self.cardinality * grams_per_unit, "g", unit), unit)
-		elif self.is_volume:
-			# Check if there's a density defined
-			density_g_per_l = self._meta.get_density_of(self.ingredient_id)
-			if density_g_per_l is not None:
-				volume_liters = self._meta.volume_units(self.cardinality, self.unit_id, "l")
-				mass_grams = density_g_per_l * volume_liters
-				return self._create_converted_to(self._meta.mass_units(mass_grams, "g", unit), unit)
-		elif self.is_mass:
-			# Just convert
-			return self._create_converted_to(self._meta.mass_units(self.cardinality, self.unit_id, unit), unit)
-
-	def _get_as_volume(self, unit = "ml"):
-		if self.is_volume:
-			# Just convert
-			return self._create_converted_to(self._meta.volume_units(self.cardinality, self.unit_id, unit), unit)
-		elif self.is_mass:
-			density_g_per_l = self._meta.get_density_of(self.ingredient_id)
-			if density_g_per_l is not None:
-				mass_grams = self._meta.mass_units(self.cardinality, self.unit_id, "g")
-				volume_liters = mass_grams / density_g_per_l
-				return self._create_converted_to(self._meta.volume_units(volume_liters, "l", unit), unit)
-
-	def _get_as_unitary(self):
-		if self.is_unitary:
-			# Just return this
-			return self
-		elif self.is_mass:
-			grams_per_unit = self._meta.get_grams_per_unit_of(self.ingredient_id)
-			if grams_per_unit is not None:
-				return self._create_converted_to(self._meta.mass_units(self.cardinality, self.unit_id, "g") / grams_per_unit, None)
-
 	def get_as(self, unit):
-		if self._meta.mass_units.is_known(unit):
-			return self._get_as_mass(unit)
-		elif self._meta.volume_units.is_known(unit):
-			return self._get_as_volume(unit)
-		elif unit == "#":
-			return self._get_as_unitary()
+		"""Returns the ingredient converted to the given unit ("#" for pieces)
+		or None if it cannot be converted. Results are memoized per unit, so
+		the returned ingredient must be treated as immutable."""
+		if self._converted is None:
+			self._converted = { }
+		elif unit in self._converted:
+			if Instrumentation.enabled:
+				Instrumentation.count("get_as.hit")
+			return self._converted[unit]
+		if Instrumentation.enabled:
+			Instrumentation.count("get_as.miss")
+
+		if self.is_unitary and (unit == "#"):
+			result = self
+		elif self.cardinality is None:
+			# No quantity given (e.g. "Salt"), nothing to convert
+			result = None
 		else:
-			return None
-
-	def get_preferred(self):
-		preferred = self._meta.get_preferred_unit_of(self.ingredient_id)
+			factor = self._meta.get_conversion_factor(self.ingredient_id, "#" if self.is_unitary else self.unit_id, unit)
+			if factor is None:
+				result = None
+			else:
+				result = self._create_converted_to(self.cardinality * factor, None if (unit == "#") else unit)
+		self._converted[unit] = result
+		return result
+
+	def get_preferred(self, metadata = None):
+		"""Returns the ingredient converted to its preferred unit, if there is
+		one. The preferred unit is part of the language metadata, so the
+		metadata of another language than the one the ingredient was loaded
+		with can be given."""
+		preferred = (metadata or self._meta).get_preferred_unit_of(self.ingredient_id)
 		alt = None
 		if (preferred is not None):
 			alt = self.get_as(unit = preferred)
@@ -148,10 +140,78 @@ class Ingredient():
 			else:
 				return "%.1f %s %s" % (self.cardinality, self.unit_id, self.ingredient_id)
 
+class _RunningTotal():
+	"""Sum of converted (and possibly scaled) ingredients of the same
+	ingredient and unit."""
+	__slots__ = ("_first", "_cardinality", "_modified")
+
+	def __init__(self, ingredient, scale = 1):
+		self._first = ingredient
+		self._cardinality = ingredient.cardinality if (scale == 1) else (ingredient.cardinality * scale)
+		self._modified = (scale != 1)
+
+	def add(self, ingredient, scale = 1):
+		self._cardinality += ingredient.cardinality if (scale == 1) else (ingredient.cardinality * scale)
+		self._modified = True
+
+	def get(self):
+		if not self._modified:
+			# Converted ingredients are memoized and must not be modified,
+			# but a single unscaled one can be used as-is
+			return self._first
+		return self._first._create_converted_to(self._cardinality, self._first.unit_id)
+
+class IngredientAccumulator():
+	"""Keeps running totals per ingredient: everything that can be converted
+	to mass is summed up in grams, everything else that can be converted to
+	volume in milliliters and whatever remains is kept as-is. Each ingredient
+	is folded in in constant time, optionally multiplied by a scale factor.
+	Iterating yields, per ingredient in order of first appearance, the mass
+	total, the volume total and the remaining items."""
+
+	def __init__(self, ingredients = None):
+		# Ingredient ID -> [ mass total, volume total, remainder ]
+		self._entries = { }
+		if ingredients is not None:
+			self.extend(ingredients)
+
+	def add(self, ingredient, scale = 1):
+		entry = self._entries.get(ingredient.ingredient_id)
+		if entry is None:
+			entry = [ None, None, [ ] ]
+			self._entries[ingredient.ingredient_id] = entry
+
+		for (index, unit) in ((0, "g"), (1, "ml")):
+			converted = ingredient.get_as(unit)
+			if converted is not None:
+				if entry[index] is None:
+					entry[index] = _RunningTotal(converted, scale)
+				else:
+					entry[index].add(converted, scale)
+				return
+
+		# Can convert neither to mass nor volume
+		if (scale != 1) and (ingredient.cardinality is not None):
+			ingredient = ingredient._create_converted_to(ingredient.cardinality * scale, ingredient.unit_id)
+		entry[2].append(ingredient)
+
+	def extend(self, ingredients, scale = 1):
+		for ingredient in ingredients:
+			self.add(ingredient, scale)
+
+	def __iter__(self):
+		for (mass_total, volume_total, remainder) in self._entries.values():
+			if mass_total is not None:
+				yield mass_total.get()
+			if volume_total is not None:
+				yield volume_total.get()
+			yield from remainder
+
 class IngredientList():
 	def __init__(self, name, items, metadata):
 		self._name = name
-		self._items = items
+		self._items = tuple(items)
+		self._accumulator = None
 		self._meta = metadata
 
 	@classmethod
@@ -163,50 +223,22 @@ class IngredientList():
 	def name(self):
 		return self._name
 
+	def extend(self, ingredients):
+		"""Merges the given ingredients into this list (see
+		IngredientAccumulator). The list of merged items is only materialized
+		when it is iterated over."""
+		if self._accumulator is None:
+			self._accumulator = IngredientAccumulator(self._items)
+		self._accumulator.extend(ingredients)
+		self._items = None
+
 	def __iadd__(self, other):
-		def merge_items(ingredients):
-			by_mass = None
-			by_volume = None
-			remainder = [ ]
-			for ingredient in ingredients:
-				as_mass = ingredient.get_as("g")
-				if as_mass is not None:
-					# Can convert to mass!
-					if by_mass is None:
-						by_mass = as_mass
-					else:
-						by_mass._cardinality += as_mass.cardinality
-					continue
-
-				as_volume = ingredient.get_as("ml")
-				if as_volume is not None:
-					# Can convert to volume!
-					if by_volume is None:
-						by_volume = as_volume
-					else:
-						by_volume._cardinality += as_volume.cardinality
-					continue
-
-				# Can convert neither to mass nor volume
-				remainder.append(ingredient)
-
-			result = [ by_mass, by_volume ] + remainder
-			result = [ ing for ing in result if ing is not None ]
-			return result
-
-		new_list = collections.defaultdict(list)
-		for ingredient in self:
-			new_list[ingredient.ingredient_id].append(ingredient)
-		for ingredient in other:
-			new_list[ingredient.ingredient_id].append(ingredient)
-
-		new_items = [ ]
-		for ingredients in new_list.values():
-			new_items += merge_items(ingredients)
-		self._items = new_items
+		self.extend(other)
 		return self
 
 	def __iter__(self):
+		if self._items is None:
+			self._items = tuple(self._accumulator)
 		return iter(self._items)
 
 	def dump(self):
@@ -220,12 +252,79 @@ class IngredientList():
 				if ingredient.get_as("#") is not None:
 					print("    unit: %.1f" % (ingredient.get_as("#").cardinality))
 
+class Preparation():
+	"""The preparation steps of a recipe, compiled from the XML subtree once
+	into a flat list of tokens per step, so that rendering, search indexing
+	and text export do not need to walk the tree again. Every token is a
+	tuple of its kind ("text", "ingredient", "temp", "time", "extent" or
+	"unknown") and its text. For ingredient references the text is the
+	ingredient ID, since the name that is displayed depends on the
+	language; for unknown nodes it is the node name."""
+
+	_KINDS = {
+		XMLNode.CDATA_NODENAME:	"text",
+		"i":					"ingredient",
+		"temp":					"temp",
+		"time":					"time",
+		"e":					"extent",
+	}
+
+	def __init__(self, steps):
+		self._steps = tuple(tuple(tokens) for tokens in steps)
+
+	@classmethod
+	def from_xmlnode(cls, node):
+		steps = [ ]
+		for step in node.step:
+			tokens = [ ]
+			for child in step.getallchildren():
+				kind = cls._KINDS.get(child.getname(), "unknown")
+				if kind == "text":
+					tokens.append((kind, child[XMLNode.CDATA_ATTRIBUTE]))
+				elif kind == "unknown":
+					tokens.append((kind, child.getname()))
+				else:
+					tokens.append((kind, child.getstrippedcdata()))
+			steps.append(tokens)
+		return cls(steps)
+
+	@property
+	def steps(self):
+		return self._steps
+
+	def ingredient_ids(self):
+		return set(text for tokens in self._steps for (kind, text) in tokens if kind == "ingredient")
+
+	def step_texts(self, metadata):
+		"""Yields the plain text of every step, with ingredient references
+		replaced by their names and whitespace collapsed."""
+		for tokens in self._steps:
+			text = "".join(metadata.getingredientname(text).singular if (kind == "ingredient") else text for (kind, text) in tokens if kind != "unknown")
+			yield " ".join(text.split())
+
 class Recipe():
-	def __init__(self, xml_filename, metadata):
-		self._xml = XMLParser().parsefile(xml_filename)
+	def __init__(self, name, ingredient_classes, serves, preparation, metadata):
+		self._name = name
+		self._ingredient_classes = tuple(ingredient_classes)
+		self._serves = serves
+		self._preparation = preparation
 		self._meta = metadata
 		self._shopping_list = self._create_shopping_list()
 
+	@classmethod
+	def from_xmlnode(cls, node, metadata):
+		ingredient_classes = [ IngredientList.from_xmlnode(child, metadata) for child in node.ingredients.getallchildren() if child.getname() != "#cdata" ]
+		if node.getchild("serves") is not None:
+			serves = [ (option["count"], option["value"]) for option in node.serves.option ]
+		else:
+			serves = None
+		return cls(name = node["name"], ingredient_classes = ingredient_classes, serves = serves, preparation = Preparation.from_xmlnode(node.preparation), metadata = metadata)
+
+	@classmethod
+	def from_xmlfile(cls, xml_filename, metadata):
+		return cls.from_xmlnode(XMLParser().parsefile(xml_filename), metadata)
+
+	@Instrumentation.timed("recipe.shopping_list", label = lambda self: self._name)
 	def _create_shopping_list(self):
 		slist = IngredientList("Shopping List", [ ], self._meta)
 		for ingredient_list in self.ingredient_classes:
@@ -234,7 +333,7 @@ class Recipe():
 
 	@property
 	def name(self):
-		return self._xml["name"]
+		return self._name
 
 	@property
 	def shopping_list(self):
@@ -242,19 +341,48 @@ class Recipe():
 
 	@property
 	def ingredient_class_cnt(self):
-		return len(list(node for node in self._xml.ingredients.getallchildren() if node.getname() != "#cdata"))
+		return len(self.ingredient_classes)
 
 	@property
 	def ingredient_classes(self):
-		for node in self._xml.ingredients.getallchildren():
-			if node.getname() != "#cdata":
-				yield IngredientList.from_xmlnode(node, self._meta)
+		return self._ingredient_classes
 
 	@property
 	def serves(self):
-		if self._xml.getchild("serves") is not None:
-			return [ (node["count"], self._meta.getservingname(node["value"])) for node in self._xml.serves.option ]
+		return self.get_serves(self._meta)
+
+	def get_serves(self, metadata):
+		"""Returns the servings as tuples of count and serving name in the
+		language of the given metadata, or None if the recipe does not
+		say."""
+		if self._serves is not None:
+			return [ (count, metadata.getservingname(serving_id)) for (count, serving_id) in self._serves ]
 
 	@property
 	def preparation(self):
-		return self._xml.preparation
+		return self._preparation
+
+	def get_serving_count(self, serving_id = None):
+		"""Returns how many servings of the given kind (by default the first
+		kind listed) the recipe makes or None if it does not say."""
+		if self._serves is not None:
+			for (count, option_id) in self._serves:
+				if (serving_id is None) or (option_id == serving_id):
+					quantity = Quantity.parse(count)
+					return quantity.exact if self._meta.exact else quantity.value
+
+	def referenced_ids(self):
+		"""Returns the IDs of all ingredients and servings that the recipe
+		refers to, i.e. the metadata entries its rendering depends on."""
+		ingredient_ids = set()
+		for ingredient_list in self.ingredient_classes:
+			for ingredient in ingredient_list:
+				ingredient_ids.add(ingredient.ingredient_id)
+		ingredient_ids |= self.preparation.ingredient_ids()
+		serving_ids = set()
+		if self._serves is not None:
+			serving_ids = set(serving_id for (count, serving_id) in self._serves)
+		return {
+			"ingredients":	sorted(ingredient_ids),
+			"servings":		sorted(serving_ids),
+		}
@@ -0,0 +1,121 @@
+#	recipes - Python-based HTML5 generation for cooking recipes
+#	Copyright (C) 2019-2019 Johannes Bauer
+#
+#	This file is part of recipes.
+#
+#	recipes is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; this program is ONLY licensed under
+#	version 3 of the License, later versions are explicitly excluded.
+#
+#	recipes is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with recipes; if not, write to the Free Software
+#	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#	Johannes Bauer <JohannesBauer@gmx.de>
+
+
+import xml.parsers.expat
+from XMLParser import XMLNode, XMLException
+from Recipe import Recipe, IngredientList, Ingredient, Preparation
+from Instrumentation import Instrumentation
+
+class RecipeLoader():
+	"""Builds Recipe objects directly from the expat event stream without
+	creating a DOM of the whole document: ingredients and servings are turned
+	into model objects as soon as their elements are encountered. Only the
+	preparation section is built as an XMLNode subtree, which is compiled into
+	a Preparation and discarded once the recipe is complete."""
+
+	def __init__(self, metadata):
+		self._meta = metadata
+		self._parser = None
+
+	def _reset(self):
+		self._parser = xml.parsers.expat.ParserCreate()
+		self._parser.StartElementHandler = self._startElementHandler
+		self._parser.EndElementHandler = self._endElementHandler
+		self._parser.CharacterDataHandler = self._cDataHandler
+		self._path = [ ]
+		self._name = None
+		self._ingredient_classes = [ ]
+		self._class_name = None
+		self._class_items = None
+		self._serves = None
+		self._preparation = None
+		self._prepnode = None
+		self._cdata = [ ]
+
+	def _flushcdata(self):
+		if len(self._cdata) > 0:
+			self._prepnode.appendcdata("".join(self._cdata))
+			self._cdata = [ ]
+
+	def _startElementHandler(self, nodename, nodeattrs):
+		depth = len(self._path)
+		if self._prepnode is not None:
+			# Inside the preparation, build the subtree
+			self._flushcdata()
+			self._prepnode = self._prepnode.addchild(XMLNode(nodename, nodeattrs, self._prepnode, self._parser.CurrentLineNumber))
+		elif depth == 0:
+			if nodename != "recipe":
+				raise XMLException("Expected <recipe> root node, but encountered <%s>." % (nodename))
+			self._name = nodeattrs["name"]
+		elif depth == 1:
+			if nodename == "preparation":
+				self._preparation = XMLNode(nodename, nodeattrs, None, self._parser.CurrentLineNumber)
+				self._prepnode = self._preparation
+			elif nodename == "serves":
+				self._serves = [ ]
+		elif depth == 2:
+			if self._path[1] == "ingredients":
+				self._class_name = nodeattrs["name"]
+				self._class_items = [ ]
+			elif (self._path[1] == "serves") and (nodename == "option"):
+				self._serves.append((nodeattrs["count"], nodeattrs["value"]))
+		elif (depth == 3) and (self._path[1] == "ingredients") and (nodename == "ingredient"):
+			self._class_items.append(Ingredient.from_attributes(nodeattrs, self._meta))
+		self._path.append(nodename)
+
+	def _endElementHandler(self, nodename):
+		self._path.pop()
+		if self._prepnode is not None:
+			self._flushcdata()
+			self._prepnode = self._prepnode.getparent()
+		elif (len(self._path) == 2) and (self._path[1] == "ingredients"):
+			self._ingredient_classes.append(IngredientList(name = self._class_name, items = self._class_items, metadata = self._meta))
+
+	def _cDataHandler(self, cdata):
+		if self._prepnode is not None:
+			self._cdata.append(cdata)
+
+	def _finish(self):
+		if self._preparation is None:
+			raise XMLException("Recipe has no <preparation> node.")
+		recipe = Recipe(name = self._name, ingredient_classes = self._ingredient_classes, serves = self._serves, preparation = Preparation.from_xmlnode(self._preparation), metadata = self._meta)
+		self._reset()
+		return recipe
+
+	def loadhandle(self, filehdl):
+		"""Load a recipe from the given file handle, which has to be opened in
+		binary mode."""
+		self._reset()
+		self._parser.ParseFile(filehdl)
+		return self._finish()
+
+	@Instrumentation.timed("recipe.loadfile", label = lambda self, filename: filename)
+	def loadfile(self, filename):
+		"""Load a recipe from the given XML file."""
+		with open(filename, "rb") as f:
+			return self.loadhandle(f)
+
+	def load(self, xmltext):
+		"""Load a recipe from the given XML text."""
+		self._reset()
+		self._parser.Parse(xmltext, True)
+		return self._finish()
@@ -0,0 +1,133 @@
+#	recipes - Python-based HTML5 generation for cooking recipes
+#	Copyright (C) 2019-2019 Johannes Bauer
+#
+#	This file is part of recipes.
+#
+#	recipes is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; this program is ONLY licensed under
+#	version 3 of the License, later versions are explicitly excluded.
+#
+#	recipes is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with recipes; if not, write to the Free Software
+#	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#	Johannes Bauer <JohannesBauer@gmx.de>
+
+
+import os
+from BuildManifest import BuildManifest
+from Metadata import Metadata
+from RecipeLoader import RecipeLoader
+from Tools import Tools
+from Instrumentation import Instrumentation
+
+class RecipeRenderer():
+	def __init__(self, templatedir, metadir, lang, metacache = None, template_cache = None, exact = False):
+		self._templatedir = templatedir
+		self._metadir = metadir
+		self._lang = lang
+		self._metacache = metacache
+		self._template_cache = template_cache
+		self._exact = exact
+		self._lookup = None
+		self._template = None
+		self._meta = None
+		self._other_meta = { }
+		self._loader = None
+
+	@staticmethod
+	def available_languages(metadir):
+		"""Returns the languages there is metadata for, i.e. the names of all
+		JSON files in the metadata directory except the conversion data."""
+		return sorted(os.path.splitext(filename)[0] for filename in os.listdir(metadir) if filename.endswith(".json") and (filename != "conversion.json"))
+
+	@property
+	def meta(self):
+		"""The metadata of the renderer's language, loaded on first use."""
+		if self._meta is None:
+			self.reload_metadata()
+		return self._meta
+
+	@property
+	def template(self):
+		"""The compiled recipe template, loaded on first use."""
+		if self._template is None:
+			self.reload_templates()
+		return self._template
+
+	def _template_module_directory(self):
+		"""Returns the directory into which mako writes the compiled Python
+		modules of the templates. It is keyed on a hash over the whole
+		template directory so that compiled modules are shared across runs
+		(and build processes) as long as no template changes, regardless of
+		file modification times."""
+		if self._template_cache is None:
+			return None
+		return os.path.join(self._template_cache, BuildManifest.hash_directory(self._templatedir))
+
+	def reload_templates(self):
+		# mako is by far the most expensive import, don't pay for it unless
+		# something is actually rendered
+		from mako.lookup import TemplateLookup
+		self._lookup = TemplateLookup([ self._templatedir ], strict_undefined = True, input_encoding = "utf-8", module_directory = self._template_module_directory())
+		self._template = self._lookup.get_template("recipe.html")
+
+	def _load_metadata(self, lang):
+		cache_filename = None if (self._metacache is None) else (self._metacache + "/" + lang + ".pickle")
+		return Metadata.load(conversion_file = self._metadir + "/conversion.json", ingredient_file = self._metadir + "/" + lang + ".json", cache_filename = cache_filename, exact = self._exact)
+
+	def reload_metadata(self):
+		self._meta = self._load_metadata(self._lang)
+		self._other_meta = { }
+		self._loader = RecipeLoader(self._meta)
+
+	def get_metadata(self, lang):
+		"""Returns the metadata of any language, loaded on first use. Recipes
+		loaded by this renderer can be rendered with the metadata of every
+		language, since the templates look up everything that depends on the
+		language in the metadata they are given."""
+		if lang == self._lang:
+			return self.meta
+		if lang not in self._other_meta:
+			self._other_meta[lang] = self._load_metadata(lang)
+		return self._other_meta[lang]
+
+	def load(self, xml_filename):
+		if self._loader is None:
+			self.reload_metadata()
+		return self._loader.loadfile(xml_filename)
+
+	@Instrumentation.timed("template.render", label = lambda self, recipe, metadata = None: recipe.name)
+	def render(self, recipe, metadata = None):
+		return self.template.render(r = recipe, m = metadata or self.meta, t = Tools)
+
+	@Instrumentation.timed("template.render", label = lambda self, recipe, f, metadata = None: recipe.name)
+	def render_to(self, recipe, f, metadata = None):
+		"""Renders the recipe directly into the given text file object instead
+		of building the page in memory first. By default, it is rendered in
+		the renderer's language; any other language can be chosen by passing
+		its metadata."""
+		from mako.runtime import Context
+		self.template.render_context(Context(f, r = recipe, m = metadata or self.meta, t = Tools))
+
+	def render_template(self, template_name, r, metadata = None):
+		"""Renders any other template of the template directory with the same
+		arguments a recipe is rendered with."""
+		if self._lookup is None:
+			self.reload_templates()
+		return self._lookup.get_template(template_name).render(r = r, m = metadata or self.meta, t = Tools)
+
+	def write_file(self, recipe, html_filename, metadata = None):
+		with Tools.atomic_write(html_filename) as f:
+			self.render_to(recipe, f, metadata)
+
+	def render_file(self, xml_filename, html_filename):
+		recipe = self.load(xml_filename)
+		self.write_file(recipe, html_filename)
+		return recipe
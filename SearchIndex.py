@@ -0,0 +1,219 @@
+#	recipes - Python-based HTML5 generation for cooking recipes
+#	Copyright (C) 2019-2019 Johannes Bauer
+#
+#	This file is part of recipes.
+#
+#	recipes is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; this program is ONLY licensed under
+#	version 3 of the License, later versions are explicitly excluded.
+#
+#	recipes is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with recipes; if not, write to the Free Software
+#	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#	Johannes Bauer <JohannesBauer@gmx.de>
+
+
+import os
+import re
+import sqlite3
+from BuildManifest import BuildManifest
+from Metadata import Metadata
+from RecipeLoader import RecipeLoader
+from SiteBuilder import SiteBuilder
+
+class SearchIndex():
+	"""On-disk (sqlite) search index over a directory of recipes. It holds an
+	inverted index from ingredient ID to the recipes that use the ingredient
+	(with the total quantity normalized to grams or milliliters) and one from
+	words of the recipe name and preparation text to recipes. It is updated
+	incrementally: only recipes whose XML has changed are re-indexed, and
+	only files whose modification time or size has changed are hashed to
+	find out. Recipes are keyed on their absolute filename, so that the same
+	directory is recognized regardless of how its path is spelled."""
+
+	_VERSION = 3
+	_TOKEN_RE = re.compile(r"\w+")
+
+	def __init__(self, filename, metadata, metadata_hash):
+		self._meta = metadata
+		self._loader = RecipeLoader(metadata)
+		self._db = sqlite3.connect(filename)
+		self._db.execute("PRAGMA journal_mode = WAL")
+		self._create_schema(metadata_hash)
+
+	def _create_schema(self, metadata_hash):
+		self._db.execute("""
+			CREATE TABLE IF NOT EXISTS properties (
+				key TEXT PRIMARY KEY,
+				value TEXT NOT NULL
+			);
+		""")
+		properties = dict(self._db.execute("SELECT key, value FROM properties;").fetchall())
+		if properties.get("version") != str(self._VERSION):
+			# Tables of other versions may lack columns
+			self._db.executescript("""
+				DROP TABLE IF EXISTS recipes;
+				DROP TABLE IF EXISTS ingredients;
+				DROP TABLE IF EXISTS tokens;
+			""")
+		self._db.executescript("""
+			CREATE TABLE IF NOT EXISTS recipes (
+				recipe_id INTEGER PRIMARY KEY,
+				filename TEXT NOT NULL UNIQUE,
+				mtime INTEGER NOT NULL,
+				size INTEGER NOT NULL,
+				hash TEXT NOT NULL,
+				name TEXT NOT NULL
+			);
+			CREATE TABLE IF NOT EXISTS ingredients (
+				ingredient_id TEXT NOT NULL,
+				recipe_id INTEGER NOT NULL,
+				grams REAL,
+				ml REAL,
+				PRIMARY KEY (ingredient_id, recipe_id)
+			) WITHOUT ROWID;
+			CREATE INDEX IF NOT EXISTS ingredients_recipe ON ingredients(recipe_id);
+			CREATE TABLE IF NOT EXISTS tokens (
+				token TEXT NOT NULL,
+				recipe_id INTEGER NOT NULL,
+				PRIMARY KEY (token, recipe_id)
+			) WITHOUT ROWID;
+			CREATE INDEX IF NOT EXISTS tokens_recipe ON tokens(recipe_id);
+		""")
+		if (properties.get("version") != str(self._VERSION)) or (properties.get("metadata") != metadata_hash):
+			# Normalized quantities and ingredient names depend on the
+			# metadata, so everything needs to be indexed again.
+			with self._db:
+				self._db.execute("DELETE FROM recipes;")
+				self._db.execute("DELETE FROM ingredients;")
+				self._db.execute("DELETE FROM tokens;")
+				self._db.execute("INSERT OR REPLACE INTO properties (key, value) VALUES ('version', ?);", (str(self._VERSION), ))
+				self._db.execute("INSERT OR REPLACE INTO properties (key, value) VALUES ('metadata', ?);", (metadata_hash, ))
+
+	@classmethod
+	def open(cls, filename, metadir, lang):
+		"""Opens (or creates) the index for the metadata of the given
+		language."""
+		conversion_file = metadir + "/conversion.json"
+		ingredient_file = metadir + "/" + lang + ".json"
+		metadata = Metadata(conversion_file = conversion_file, ingredient_file = ingredient_file)
+		metadata_hash = BuildManifest.hash_file(conversion_file) + ":" + BuildManifest.hash_file(ingredient_file)
+		return cls(filename, metadata, metadata_hash)
+
+	@property
+	def metadata(self):
+		return self._meta
+
+	@property
+	def is_empty(self):
+		return self._db.execute("SELECT recipe_id FROM recipes LIMIT 1;").fetchone() is None
+
+	@classmethod
+	def tokenize(cls, text):
+		return set(token.lower() for token in cls._TOKEN_RE.findall(text))
+
+	def _remove(self, recipe_id):
+		self._db.execute("DELETE FROM ingredients WHERE recipe_id = ?;", (recipe_id, ))
+		self._db.execute("DELETE FROM tokens WHERE recipe_id = ?;", (recipe_id, ))
+		self._db.execute("DELETE FROM recipes WHERE recipe_id = ?;", (recipe_id, ))
+
+	def _index(self, filename, stat, file_hash):
+		recipe = self._loader.loadfile(filename)
+		row = self._db.execute("SELECT recipe_id FROM recipes WHERE filename = ?;", (filename, )).fetchone()
+		if row is not None:
+			self._remove(row[0])
+		recipe_id = self._db.execute("INSERT INTO recipes (filename, mtime, size, hash, name) VALUES (?, ?, ?, ?, ?);", (filename, stat.st_mtime_ns, stat.st_size, file_hash, recipe.name)).lastrowid
+
+		quantities = { }
+		for ingredient in recipe.shopping_list:
+			(grams, ml) = quantities.get(ingredient.ingredient_id, (None, None))
+			if ingredient.unit_id == "g":
+				grams = ingredient.cardinality
+			elif ingredient.unit_id == "ml":
+				ml = ingredient.cardinality
+			quantities[ingredient.ingredient_id] = (grams, ml)
+		for ingredient_id in recipe.referenced_ids()["ingredients"]:
+			quantities.setdefault(ingredient_id, (None, None))
+		self._db.executemany("INSERT INTO ingredients (ingredient_id, recipe_id, grams, ml) VALUES (?, ?, ?, ?);", [ (ingredient_id, recipe_id, grams, ml) for (ingredient_id, (grams, ml)) in quantities.items() ])
+
+		tokens = self.tokenize(recipe.name) | self.tokenize(" ".join(recipe.preparation.step_texts(self._meta)))
+		self._db.executemany("INSERT INTO tokens (token, recipe_id) VALUES (?, ?);", [ (token, recipe_id) for token in tokens ])
+
+	def update_file(self, filename):
+		"""Re-indexes a single recipe file if it has changed (or removes it
+		from the index if it does not exist anymore). Returns True if the
+		index was changed."""
+		filename = os.path.abspath(filename)
+		row = self._db.execute("SELECT recipe_id, mtime, size, hash FROM recipes WHERE filename = ?;", (filename, )).fetchone()
+		with self._db:
+			try:
+				stat = os.stat(filename)
+			except FileNotFoundError:
+				if row is None:
+					return False
+				self._remove(row[0])
+				return True
+			if (row is not None) and (row[1] == stat.st_mtime_ns) and (row[2] == stat.st_size):
+				return False
+			file_hash = BuildManifest.hash_file(filename)
+			if (row is not None) and (row[3] == file_hash):
+				# Only touched, remember the new modification time
+				self._db.execute("UPDATE recipes SET mtime = ?, size = ? WHERE recipe_id = ?;", (stat.st_mtime_ns, stat.st_size, row[0]))
+				return False
+			self._index(filename, stat, file_hash)
+			return True
+
+	def update(self, source_dir):
+		"""Brings the index up to date with all recipes of a directory.
+		Returns the number of recipes that were (re-)indexed or removed."""
+		source_dir = os.path.abspath(source_dir)
+		filenames = SiteBuilder.source_files(source_dir)
+		changed = 0
+		for filename in filenames:
+			if self.update_file(filename):
+				changed += 1
+		known = set(filename for (filename, ) in self._db.execute("SELECT filename FROM recipes;"))
+		for filename in sorted(known - set(filenames)):
+			if os.path.dirname(filename) == source_dir:
+				self.update_file(filename)
+				changed += 1
+		return changed
+
+	def query(self, ingredients = None, excluded_ingredients = None, max_quantities = None, min_quantities = None, words = None):
+		"""Returns a list of (filename, name) tuples of all recipes that use
+		all of the given ingredients, none of the excluded ingredients,
+		satisfy all quantity limits and contain all given words in their name
+		or preparation. Quantity limits are dictionaries that map an
+		ingredient ID to a tuple of quantity and unit ("g" or "ml")."""
+		conditions = [ ]
+		parameters = [ ]
+		for ingredient_id in (ingredients or [ ]):
+			conditions.append("recipe_id IN (SELECT recipe_id FROM ingredients WHERE ingredient_id = ?)")
+			parameters.append(ingredient_id)
+		for ingredient_id in (excluded_ingredients or [ ]):
+			conditions.append("recipe_id NOT IN (SELECT recipe_id FROM ingredients WHERE ingredient_id = ?)")
+			parameters.append(ingredient_id)
+		for (operator, limits) in (("<", max_quantities), (">", min_quantities)):
+			for (ingredient_id, (quantity, unit)) in (limits or { }).items():
+				column = { "g": "grams", "ml": "ml" }[unit]
+				conditions.append("recipe_id IN (SELECT recipe_id FROM ingredients WHERE ingredient_id = ? AND %s %s ?)" % (column, operator))
+				parameters += [ ingredient_id, quantity ]
+		for word in (words or [ ]):
+			for token in self.tokenize(word):
+				conditions.append("recipe_id IN (SELECT recipe_id FROM tokens WHERE token = ?)")
+				parameters.append(token)
+		sql = "SELECT filename, name FROM recipes"
+		if len(conditions) > 0:
+			sql += " WHERE " + " AND ".join(conditions)
+		sql += " ORDER BY name, filename;"
+		return self._db.execute(sql, parameters).fetchall()
+
+	def close(self):
+		self._db.close()
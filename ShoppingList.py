@@ -0,0 +1,181 @@
+#	recipes - Python-based HTML5 generation for cooking recipes
+#	Copyright (C) 2019-2019 Johannes Bauer
+#
+#	This file is part of recipes.
+#
+#	recipes is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; this program is ONLY licensed under
+#	version 3 of the License, later versions are explicitly excluded.
+#
+#	recipes is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with recipes; if not, write to the Free Software
+#	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#	Johannes Bauer <JohannesBauer@gmx.de>
+
+
+import math
+import json
+from Recipe import Ingredient, IngredientAccumulator
+from Quantity import Quantity
+
+class ShoppingListItem():
+	def __init__(self, ingredient_id, unit_id, metadata):
+		self._ingredient_id = ingredient_id
+		self._unit_id = unit_id
+		self._meta = metadata
+		self._cardinality = None
+		self._ingredient = None
+
+	@property
+	def ingredient_id(self):
+		return self._ingredient_id
+
+	@property
+	def unit_id(self):
+		return self._unit_id
+
+	@property
+	def cardinality(self):
+		return self._cardinality
+
+	@property
+	def ingredient(self):
+		"""The accumulated quantity as an Ingredient, e.g. for rendering."""
+		if self._ingredient is None:
+			self._ingredient = Ingredient(ingredient_id = self._ingredient_id, cardinality = self._cardinality, unit_id = self._unit_id, metadata = self._meta)
+		return self._ingredient
+
+	@property
+	def preferred(self):
+		"""The accumulated quantity in the preferred unit of the ingredient."""
+		return self.ingredient.get_preferred()
+
+	def add(self, cardinality):
+		if cardinality is not None:
+			self._cardinality = cardinality if (self._cardinality is None) else (self._cardinality + cardinality)
+			self._ingredient = None
+
+	@staticmethod
+	def _parse_pack_size(text):
+		"""Parses a pack size like "250 g" or "10" (pieces) into a tuple of
+		quantity and unit. Returns None for sizes that cannot be parsed."""
+		(count, _, unit_id) = text.strip().partition(" ")
+		try:
+			cardinality = Quantity.parse(count).value
+		except ValueError:
+			return None
+		return (cardinality, unit_id.strip() or None)
+
+	@property
+	def packs(self):
+		"""Returns a tuple of pack name and number of packs that need to be
+		bought for the accumulated quantity, choosing the kind of pack that
+		leaves the least amount unused. Returns None if the ingredient is not
+		sold in packs that can be converted to the unit of the item."""
+		sold = self._meta.get_ingredient(self._ingredient_id).sold
+		if (sold is None) or (self._cardinality is None):
+			return None
+		best = None
+		for (pack_name, pack_size) in sold.items():
+			pack_size = self._parse_pack_size(pack_size)
+			if pack_size is None:
+				continue
+			(pack_cardinality, pack_unit_id) = pack_size
+			factor = self._meta.get_conversion_factor(self._ingredient_id, pack_unit_id or "#", self._unit_id or "#")
+			if (factor is None) or (pack_cardinality <= 0):
+				continue
+			pack_amount = pack_cardinality * factor
+			# Allow for rounding errors so that exactly one pack worth is not
+			# rounded up to two packs
+			count = max(math.ceil(self._cardinality / pack_amount - 1e-9), 1)
+			excess = count * pack_amount - self._cardinality
+			if (best is None) or ((excess, count) < best[0]):
+				best = ((excess, count), pack_name, count)
+		if best is None:
+			return None
+		return (best[1], best[2])
+
+	def to_dict(self):
+		preferred = self.preferred
+		result = {
+			"ingredient":	self._ingredient_id,
+			"name":			preferred.ingredient_name(preferred.cardinality),
+			"quantity":		None if (preferred.cardinality is None) else float(preferred.cardinality),
+			"unit":			preferred.unit_id,
+		}
+		packs = self.packs
+		if packs is not None:
+			result["packs"] = { "name": packs[0], "count": packs[1] }
+		return result
+
+class ShoppingList():
+	"""Aggregates the ingredients of many (scaled) recipes. Ingredients are
+	merged by an IngredientAccumulator, i.e., in constant time per ingredient
+	and with the same mass/volume policy as a recipe's own shopping list.
+	Items are only materialized when the list is iterated over; leftover
+	items in the same unit are then summed up as well."""
+
+	def __init__(self, metadata, name = None):
+		self._meta = metadata
+		self._name = name if (name is not None) else metadata.getstring("shopping_list")
+		self._accumulator = IngredientAccumulator()
+		self._items = None
+		self._recipes = [ ]
+
+	@property
+	def name(self):
+		return self._name
+
+	@property
+	def recipes(self):
+		"""List of (recipe, scale factor) tuples that have been added."""
+		return self._recipes
+
+	def add_ingredient(self, ingredient, scale = 1):
+		self._accumulator.add(ingredient, scale)
+		self._items = None
+
+	def add_recipe(self, recipe, scale = 1):
+		self._recipes.append((recipe, scale))
+		for ingredient_list in recipe.ingredient_classes:
+			self._accumulator.extend(ingredient_list, scale)
+		self._items = None
+
+	def _get_items(self):
+		if self._items is None:
+			items = { }
+			for ingredient in self._accumulator:
+				key = (ingredient.ingredient_id, ingredient.unit_id)
+				item = items.get(key)
+				if item is None:
+					item = ShoppingListItem(ingredient.ingredient_id, ingredient.unit_id, self._meta)
+					items[key] = item
+				item.add(ingredient.cardinality)
+			self._items = list(items.values())
+		return self._items
+
+	def __iter__(self):
+		"""Iterates over all items, grouped by ingredient in the order in which
+		the ingredients were first encountered."""
+		return iter(self._get_items())
+
+	def __len__(self):
+		return len(self._get_items())
+
+	def to_dict(self):
+		return {
+			"name":		self._name,
+			"recipes":	[ { "name": recipe.name, "scale": float(scale) } for (recipe, scale) in self._recipes ],
+			"items":	[ item.to_dict() for item in self ],
+		}
+
+	def write_json(self, f):
+		json.dump(self.to_dict(), f, indent = 4, ensure_ascii = False)
+		print(file = f)
@@ -0,0 +1,224 @@
+#	recipes - Python-based HTML5 generation for cooking recipes
+#	Copyright (C) 2019-2019 Johannes Bauer
+#
+#	This file is part of recipes.
+#
+#	recipes is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; this program is ONLY licensed under
+#	version 3 of the License, later versions are explicitly excluded.
+#
+#	recipes is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with recipes; if not, write to the Free Software
+#	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#	Johannes Bauer <JohannesBauer@gmx.de>
+
+
+import os
+import io
+import time
+import shutil
+import functools
+import contextlib
+import multiprocessing
+from RecipeRenderer import RecipeRenderer
+from BuildManifest import BuildManifest, MetadataDigest
+from SiteIndex import SiteIndex
+from Instrumentation import Instrumentation
+
+_worker_renderer = None
+
+def _worker_initialize(renderer_factory, instrument):
+	global _worker_renderer
+	Instrumentation.enable(instrument)
+	_worker_renderer = renderer_factory()
+
+def _worker_render(task):
+	return SiteBuilder.render_one(_worker_renderer, *task)
+
+class SiteBuilder():
+	"""Builds the pages of all recipes of the source directory in the given
+	language. If a list of languages is given as well, every recipe is
+	parsed once and rendered in each of these languages into a subdirectory
+	of the output directory that is named after the language."""
+
+	def __init__(self, source_dir, output_dir, templatedir, metadir, lang, staticdir = None, metacache = None, template_cache = None, exact = False, languages = None, force = False, incremental = False, verbose = False, timing = False, jobs = 1):
+		self._source_dir = source_dir
+		self._templatedir = templatedir
+		self._metadir = metadir
+		self._staticdir = staticdir
+		self._exact = exact
+		self._force = force
+		self._incremental = incremental
+		self._verbose = verbose
+		self._timing = timing
+		self._jobs = jobs if (jobs > 0) else multiprocessing.cpu_count()
+		if languages is None:
+			self._targets = [ (lang, output_dir) ]
+		else:
+			self._targets = [ (language, output_dir + "/" + language) for language in languages ]
+		self._renderer_factory = functools.partial(RecipeRenderer, templatedir = templatedir, metadir = metadir, lang = lang, metacache = metacache, template_cache = template_cache, exact = exact)
+
+	@staticmethod
+	def recipe_name(xml_filename):
+		return os.path.splitext(os.path.basename(xml_filename))[0]
+
+	@staticmethod
+	def render_one(renderer, xml_filename, outputs, verbose):
+		"""Renders a single recipe into the output file of every given
+		language (a list of tuples of language and output filename). The
+		recipe is parsed and its model built only once. Returns a tuple of
+		the time it took, the verbose ingredient dump (which is captured so
+		that output of parallel workers does not interleave), the metadata
+		IDs the recipe refers to, its search index entry per language and,
+		if enabled, the instrumentation data recorded while rendering it."""
+		t0 = time.perf_counter()
+		recipe = renderer.load(xml_filename)
+		search_entries = { }
+		for (lang, html_filename) in outputs:
+			metadata = renderer.get_metadata(lang)
+			renderer.write_file(recipe, html_filename, metadata)
+			search_entries[lang] = SiteIndex.entry_for(recipe, metadata)
+		t1 = time.perf_counter()
+		dump = None
+		if verbose:
+			f = io.StringIO()
+			with contextlib.redirect_stdout(f):
+				for iclass in recipe.ingredient_classes:
+					iclass.dump()
+					print("-" * 120)
+			dump = f.getvalue()
+		instrumentation = Instrumentation.drain() if Instrumentation.enabled else None
+		return (t1 - t0, dump, recipe.referenced_ids(), search_entries, instrumentation)
+
+	@staticmethod
+	def _manifest_filename(output_dir):
+		return output_dir + "/.manifest.json"
+
+	@staticmethod
+	def source_files(source_dir):
+		filenames = [ filename for filename in os.listdir(source_dir) if filename.endswith(".xml") ]
+		filenames.sort(key = lambda filename: (filename.lower(), filename))
+		return [ source_dir + "/" + filename for filename in filenames ]
+
+	@staticmethod
+	def _output_filename(output_dir, name):
+		return output_dir + "/" + name + ".html"
+
+	def _copy_static(self, output_dir, manifest):
+		static_files = BuildManifest.list_directory(self._staticdir)
+		for (relname, filename) in static_files:
+			file_hash = BuildManifest.hash_file(filename)
+			output_filename = output_dir + "/" + relname
+			if self._incremental and os.path.exists(output_filename) and manifest.static_uptodate(relname, file_hash):
+				continue
+			os.makedirs(os.path.dirname(output_filename), exist_ok = True)
+			shutil.copyfile(filename, output_filename)
+			manifest.set_static(relname, file_hash)
+
+		removed_relnames = set(manifest.static) - set(relname for (relname, filename) in static_files)
+		for relname in removed_relnames:
+			if os.path.exists(output_dir + "/" + relname):
+				os.unlink(output_dir + "/" + relname)
+			manifest.remove_static(relname)
+
+	def _remove_unknown_pages(self, output_dir, names):
+		"""Removes the pages of an output directory without a (usable) build
+		manifest, e.g. a site that was built by other means before, that do not
+		belong to any current recipe. Otherwise they would never be removed."""
+		known_filenames = set(os.path.basename(self._output_filename(output_dir, name)) for name in names)
+		known_filenames.add("index.html")
+		for filename in os.listdir(output_dir):
+			if filename.endswith(".html") and (filename not in known_filenames) and os.path.isfile(output_dir + "/" + filename):
+				os.unlink(output_dir + "/" + filename)
+
+	def _render_all(self, tasks):
+		"""Yields the results of all render tasks in the order of the tasks,
+		regardless of how many worker processes are used."""
+		jobs = min(self._jobs, len(tasks))
+		if jobs <= 1:
+			if len(tasks) > 0:
+				renderer = self._renderer_factory()
+				for task in tasks:
+					yield self.render_one(renderer, *task)
+		else:
+			with multiprocessing.Pool(processes = jobs, initializer = _worker_initialize, initargs = (self._renderer_factory, Instrumentation.enabled)) as pool:
+				yield from pool.imap(_worker_render, tasks, chunksize = 1)
+
+	def build(self):
+		t0 = time.perf_counter()
+		xml_filenames = self.source_files(self._source_dir)
+		names = [ self.recipe_name(xml_filename) for xml_filename in xml_filenames ]
+
+		if (not self._force) and (not self._incremental):
+			for (lang, output_dir) in self._targets:
+				for name in names:
+					if os.path.exists(self._output_filename(output_dir, name)):
+						raise FileExistsError("Output file '%s' exists, not continuing." % (self._output_filename(output_dir, name)))
+
+		template_hash = BuildManifest.hash_directory(self._templatedir)
+		manifests = { }
+		metadata_digests = { }
+		for (lang, output_dir) in self._targets:
+			os.makedirs(output_dir, exist_ok = True)
+			if self._incremental:
+				manifests[lang] = BuildManifest.load(self._manifest_filename(output_dir))
+				if len(manifests[lang].pages) == 0:
+					self._remove_unknown_pages(output_dir, names)
+			else:
+				manifests[lang] = BuildManifest(self._manifest_filename(output_dir))
+			if self._staticdir is not None:
+				self._copy_static(output_dir, manifests[lang])
+			metadata_digests[lang] = MetadataDigest(conversion_file = self._metadir + "/conversion.json", ingredient_file = self._metadir + "/" + lang + ".json", exact = self._exact)
+
+		tasks = [ ]
+		task_info = [ ]
+		for (xml_filename, name) in zip(xml_filenames, names):
+			source_hash = BuildManifest.hash_file(xml_filename)
+			outputs = [ ]
+			for (lang, output_dir) in self._targets:
+				output_filename = self._output_filename(output_dir, name)
+				if self._incremental and os.path.exists(output_filename) and manifests[lang].page_uptodate(name, source_hash, template_hash, lang, metadata_digests[lang]):
+					continue
+				outputs.append((lang, output_filename))
+			if len(outputs) > 0:
+				tasks.append((xml_filename, outputs, self._verbose))
+				task_info.append((name, source_hash))
+
+		changed_languages = set()
+		for ((name, source_hash), (duration, dump, referenced_ids, search_entries, instrumentation)) in zip(task_info, self._render_all(tasks)):
+			if instrumentation is not None:
+				Instrumentation.merge(instrumentation)
+			if dump is not None:
+				print(dump, end = "")
+			if self._timing:
+				print("%-40s %8.1f ms" % (name, duration * 1000))
+			for (lang, search_entry) in search_entries.items():
+				manifests[lang].set_page(name, source_hash, template_hash, lang, referenced_ids, metadata_digests[lang](referenced_ids), search_entry)
+				changed_languages.add(lang)
+
+		for (lang, output_dir) in self._targets:
+			manifest = manifests[lang]
+			removed_names = set(manifest.pages) - set(names)
+			for name in removed_names:
+				if os.path.exists(self._output_filename(output_dir, name)):
+					os.unlink(self._output_filename(output_dir, name))
+				manifest.remove_page(name)
+
+			if (lang in changed_languages) or (len(removed_names) > 0) or (not os.path.exists(output_dir + "/index.html")):
+				index = SiteIndex()
+				for name in names:
+					index.add(name, manifest.get_search_entry(name))
+				index.write(output_dir)
+			manifest.write()
+		t1 = time.perf_counter()
+		if self._timing:
+			languages = "" if (len(self._targets) == 1) else " in %d languages" % (len(self._targets))
+			print("Rendered %d of %d recipes%s in %.3f s using %d process(es)." % (len(tasks), len(names), languages, t1 - t0, max(min(self._jobs, len(tasks)), 1)))
+		return names
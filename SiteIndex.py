@@ -0,0 +1,93 @@
+#	recipes - Python-based HTML5 generation for cooking recipes
+#	Copyright (C) 2019-2019 Johannes Bauer
+#
+#	This file is part of recipes.
+#
+#	recipes is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; this program is ONLY licensed under
+#	version 3 of the License, later versions are explicitly excluded.
+#
+#	recipes is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with recipes; if not, write to the Free Software
+#	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#	Johannes Bauer <JohannesBauer@gmx.de>
+
+
+import json
+from Tools import Tools
+from Quantity import Quantity
+
+class SiteIndex():
+	"""Writes the index page of a site build together with search.json, a
+	compact search index that static/search.js uses to filter recipes by
+	name and ingredient in the browser. Every ingredient (ID and localized
+	names) is only stored once in the search index and referred to by
+	position from the recipes."""
+
+	def __init__(self):
+		self._pages = [ ]
+
+	@staticmethod
+	def entry_for(recipe, metadata):
+		"""Returns the search data of a recipe. This is a plain dictionary so
+		that it can be passed between processes and stored in the build
+		manifest."""
+		ingredients = { }
+		for ingredient_list in recipe.ingredient_classes:
+			for ingredient in ingredient_list:
+				name = metadata.getingredientname(ingredient.ingredient_id)
+				ingredients[ingredient.ingredient_id] = name.singular if (name.singular == name.plural) else (name.singular + " " + name.plural)
+		serves = [ ]
+		for (count, serving_name) in (recipe.get_serves(metadata) or [ ]):
+			try:
+				count = Quantity.parse(count).value
+			except ValueError:
+				# Free-form counts like "a few" are only shown as text
+				count = None
+			serves.append((count, serving_name.plural))
+		return {
+			"name":			recipe.name,
+			"ingredients":	ingredients,
+			"serves":		serves,
+		}
+
+	def add(self, page_name, entry):
+		self._pages.append((page_name, entry))
+
+	def _search_index(self):
+		ingredient_ids = sorted(set(ingredient_id for (page_name, entry) in self._pages for ingredient_id in entry["ingredients"]))
+		ingredient_index = { ingredient_id: index for (index, ingredient_id) in enumerate(ingredient_ids) }
+		ingredient_names = { }
+		for (page_name, entry) in self._pages:
+			ingredient_names.update(entry["ingredients"])
+		return {
+			"ingredients":	[ [ ingredient_id, ingredient_names[ingredient_id] ] for ingredient_id in ingredient_ids ],
+			"recipes":		[ [ page_name, entry["name"], sorted(ingredient_index[ingredient_id] for ingredient_id in entry["ingredients"]), entry["serves"] ] for (page_name, entry) in self._pages ],
+		}
+
+	def write(self, output_dir):
+		with Tools.atomic_write(output_dir + "/search.json") as f:
+			json.dump(self._search_index(), f, ensure_ascii = False, separators = (",", ":"))
+
+		with Tools.atomic_write(output_dir + "/index.html") as f:
+			print("<html>", file = f)
+			print("<head>", file = f)
+			print("<meta charset=\"utf-8\" />", file = f)
+			print("<script src=\"search.js\"></script>", file = f)
+			print("</head>", file = f)
+			print("<body>", file = f)
+			print("<input type=\"search\" id=\"search\" style=\"display: none\" />", file = f)
+			print("<div id=\"recipes\">", file = f)
+			for (page_name, entry) in self._pages:
+				print("<div class=\"recipe\"><a href=\"%s.html\">%s</a></div>" % (page_name, page_name), file = f)
+			print("</div>", file = f)
+			print("<script>initialize_search(\"search.json\");</script>", file = f)
+			print("</body>", file = f)
+			print("</html>", file = f)
@@ -0,0 +1,242 @@
+#	recipes - Python-based HTML5 generation for cooking recipes
+#	Copyright (C) 2019-2019 Johannes Bauer
+#
+#	This file is part of recipes.
+#
+#	recipes is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; this program is ONLY licensed under
+#	version 3 of the License, later versions are explicitly excluded.
+#
+#	recipes is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with recipes; if not, write to the Free Software
+#	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#	Johannes Bauer <JohannesBauer@gmx.de>
+
+
+import os
+import time
+import shutil
+import threading
+import functools
+import http.server
+from RecipeRenderer import RecipeRenderer
+from Recipe import Recipe
+from XMLParser import XMLParser
+from BuildManifest import BuildManifest, MetadataDigest
+from SiteBuilder import SiteBuilder
+from SiteIndex import SiteIndex
+from Tools import Tools
+
+class _QuietRequestHandler(http.server.SimpleHTTPRequestHandler):
+	def log_message(self, format, *args):
+		pass
+
+class SiteWatcher():
+	"""Keeps metadata, templates and all parsed recipes resident, polls the
+	source, metadata, template and static directories for changes and
+	re-renders only the pages that are affected by a change. Optionally serves
+	the output directory over HTTP."""
+
+	def __init__(self, source_dir, output_dir, templatedir, metadir, lang, staticdir = None, metacache = None, template_cache = None, exact = False, port = None, poll_interval = 0.2, verbose = False):
+		self._source_dir = source_dir
+		self._output_dir = output_dir
+		self._templatedir = templatedir
+		self._metadir = metadir
+		self._lang = lang
+		self._staticdir = staticdir
+		self._metacache = metacache
+		self._template_cache = template_cache
+		self._exact = exact
+		self._port = port
+		self._poll_interval = poll_interval
+		self._verbose = verbose
+		self._renderer = None
+		self._digest = None
+		self._trees = { }
+		self._recipes = { }
+		self._snapshots = { }
+
+	@property
+	def _conversion_file(self):
+		return self._metadir + "/conversion.json"
+
+	@property
+	def _ingredient_file(self):
+		return self._metadir + "/" + self._lang + ".json"
+
+	def _log(self, msg):
+		print("%s %s" % (time.strftime("%H:%M:%S"), msg))
+
+	@staticmethod
+	def _snapshot(dirname):
+		"""Returns a dictionary of all files in a directory tree with their
+		modification time and size."""
+		snapshot = { }
+		if (dirname is not None) and os.path.isdir(dirname):
+			for (relname, filename) in BuildManifest.list_directory(dirname):
+				try:
+					stat = os.stat(filename)
+				except FileNotFoundError:
+					continue
+				snapshot[relname] = (stat.st_mtime_ns, stat.st_size)
+		return snapshot
+
+	def _poll(self, dirname):
+		"""Returns the set of relative filenames which have been added,
+		changed or removed since the last poll of the given directory."""
+		old = self._snapshots.get(dirname, { })
+		new = self._snapshot(dirname)
+		self._snapshots[dirname] = new
+		return set(relname for relname in old.keys() | new.keys() if old.get(relname) != new.get(relname))
+
+	def _output_filename(self, name):
+		return self._output_dir + "/" + name + ".html"
+
+	def _render(self, name):
+		t0 = time.perf_counter()
+		with Tools.atomic_write(self._output_filename(name)) as f:
+			self._renderer.render_to(self._recipes[name], f)
+		t1 = time.perf_counter()
+		if self._verbose:
+			self._log("Rendered %s in %.1f ms" % (name, (t1 - t0) * 1000))
+
+	def _load(self, name):
+		xml_filename = self._source_dir + "/" + name + ".xml"
+		try:
+			self._trees[name] = XMLParser().parsefile(xml_filename)
+			self._recipes[name] = Recipe.from_xmlnode(self._trees[name], self._renderer.meta)
+		except Exception as e:
+			self._log("Cannot load %s: %s" % (xml_filename, str(e)))
+			return False
+		return True
+
+	def _render_all(self, names):
+		for name in names:
+			try:
+				self._render(name)
+			except Exception as e:
+				self._log("Cannot render %s: %s" % (name, str(e)))
+
+	def _write_index(self):
+		index = SiteIndex()
+		for xml_filename in SiteBuilder.source_files(self._source_dir):
+			name = SiteBuilder.recipe_name(xml_filename)
+			if name in self._recipes:
+				index.add(name, SiteIndex.entry_for(self._recipes[name], self._renderer.meta))
+		index.write(self._output_dir)
+
+	def _copy_static(self, relnames):
+		for relname in sorted(relnames):
+			filename = self._staticdir + "/" + relname
+			output_filename = self._output_dir + "/" + relname
+			if os.path.exists(filename):
+				os.makedirs(os.path.dirname(output_filename), exist_ok = True)
+				shutil.copyfile(filename, output_filename)
+			elif os.path.exists(output_filename):
+				os.unlink(output_filename)
+
+	def _handle_source_changes(self, relnames):
+		index_changed = False
+		changed = [ ]
+		for relname in sorted(relnames):
+			if (not relname.endswith(".xml")) or ("/" in relname):
+				continue
+			name = SiteBuilder.recipe_name(relname)
+			if os.path.exists(self._source_dir + "/" + relname):
+				index_changed = index_changed or (name not in self._recipes)
+				if self._load(name):
+					changed.append(name)
+			elif name in self._recipes:
+				self._log("Removed %s" % (name))
+				del self._trees[name]
+				del self._recipes[name]
+				if os.path.exists(self._output_filename(name)):
+					os.unlink(self._output_filename(name))
+				index_changed = True
+		self._render_all(changed)
+		if len(changed) > 0:
+			# Names and ingredients of changed recipes are in the index
+			index_changed = True
+		if index_changed:
+			self._write_index()
+
+	def _handle_metadata_change(self):
+		try:
+			self._renderer.reload_metadata()
+			new_digest = MetadataDigest(conversion_file = self._conversion_file, ingredient_file = self._ingredient_file, exact = self._exact)
+		except Exception as e:
+			self._log("Cannot load metadata: %s" % (str(e)))
+			return
+
+		# Rebind all resident recipes to the new metadata (this does not
+		# require parsing them again), but only re-render those whose
+		# referenced metadata entries actually have changed.
+		changed = [ ]
+		for (name, recipe) in sorted(self._recipes.items()):
+			referenced_ids = recipe.referenced_ids()
+			if self._digest(referenced_ids) != new_digest(referenced_ids):
+				changed.append(name)
+			self._recipes[name] = Recipe.from_xmlnode(self._trees[name], self._renderer.meta)
+		self._digest = new_digest
+		self._log("Metadata changed, %d of %d recipes affected" % (len(changed), len(self._recipes)))
+		self._render_all(changed)
+		if len(changed) > 0:
+			self._write_index()
+
+	def _handle_template_change(self):
+		try:
+			self._renderer.reload_templates()
+		except Exception as e:
+			self._log("Cannot compile templates: %s" % (str(e)))
+			return
+		self._log("Templates changed, re-rendering all %d recipes" % (len(self._recipes)))
+		self._render_all(sorted(self._recipes))
+
+	def _initial_build(self):
+		os.makedirs(self._output_dir, exist_ok = True)
+		self._renderer = RecipeRenderer(templatedir = self._templatedir, metadir = self._metadir, lang = self._lang, metacache = self._metacache, template_cache = self._template_cache, exact = self._exact)
+		self._digest = MetadataDigest(conversion_file = self._conversion_file, ingredient_file = self._ingredient_file, exact = self._exact)
+		self._poll(self._metadir)
+		self._poll(self._templatedir)
+		if self._staticdir is not None:
+			self._copy_static(self._poll(self._staticdir))
+		self._handle_source_changes(self._poll(self._source_dir))
+		self._write_index()
+		self._log("Built %d recipes, watching for changes" % (len(self._recipes)))
+
+	def _start_server(self):
+		handler_class = http.server.SimpleHTTPRequestHandler if self._verbose else _QuietRequestHandler
+		handler = functools.partial(handler_class, directory = self._output_dir)
+		server = http.server.ThreadingHTTPServer(("localhost", self._port), handler)
+		thread = threading.Thread(target = server.serve_forever, daemon = True)
+		thread.start()
+		self._log("Serving %s on http://localhost:%d/" % (self._output_dir, server.server_address[1]))
+		return server
+
+	def run(self):
+		self._initial_build()
+		server = None
+		if self._port is not None:
+			server = self._start_server()
+		try:
+			while True:
+				time.sleep(self._poll_interval)
+				if len(self._poll(self._metadir)) > 0:
+					self._handle_metadata_change()
+				if len(self._poll(self._templatedir)) > 0:
+					self._handle_template_change()
+				if self._staticdir is not None:
+					self._copy_static(self._poll(self._staticdir))
+				self._handle_source_changes(self._poll(self._source_dir))
+		except KeyboardInterrupt:
+			pass
+		finally:
+			if server is not None:
+				server.shutdown()
@@ -0,0 +1,132 @@
+#	recipes - Python-based HTML5 generation for cooking recipes
+#	Copyright (C) 2019-2019 Johannes Bauer
+#
+#	This file is part of recipes.
+#
+#	recipes is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; this program is ONLY licensed under
+#	version 3 of the License, later versions are explicitly excluded.
+#
+#	recipes is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with recipes; if not, write to the Free Software
+#	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+#	Johannes Bauer <JohannesBauer@gmx.de>
+
+
+import os
+import json
+import random
+from xml.sax.saxutils import quoteattr
+
+class SyntheticCorpus():
+	"""Generates recipe XML documents of configurable size for benchmarking.
+	Ingredients, units and servings are real IDs taken from the metadata
+	files so that the generated recipes exercise the same conversions as
+	real ones. Generation is deterministic for a given seed."""
+	_WORDS = ("und", "die", "den", "mit", "in", "einer", "Schüssel", "verrühren", "unterheben", "vermischen", "Teig", "Form", "backen", "abkühlen", "lassen", "kurz", "langsam", "dann", "etwa", "gut", "schlagen", "schmelzen", "Ofen", "vorheizen")
+
+	def __init__(self, conversion_file, ingredient_file, seed = 0):
+		with open(conversion_file) as f:
+			conversion = json.load(f)
+		with open(ingredient_file) as f:
+			language = json.load(f)
+		self._seed = seed
+		self._ingredient_ids = sorted(set(conversion["ingredients"]) | set(language["ingredients"]))
+		self._serving_ids = sorted(language.get("servings", { }))
+		mass_units = sorted(conversion["units"]["mass"])
+		volume_units = sorted(conversion["units"]["volume"])
+		other_units = sorted(set(language.get("units", { })) - set(mass_units) - set(volume_units))
+
+		# Per ingredient, the units it is plausibly given in. Units that only
+		# have a name (pinch, bottle, ...) are used occasionally for any
+		# ingredient.
+		self._other_units = other_units
+		self._units = { }
+		for ingredient_id in self._ingredient_ids:
+			data = conversion["ingredients"].get(ingredient_id, { })
+			units = [ "g" ]
+			if "density_g_per_l" in data:
+				units += mass_units + volume_units
+			if "unit_weight_grams" in data:
+				units.append(None)
+			units += sorted(data.get("conversions", { }))
+			self._units[ingredient_id] = units
+
+	@property
+	def ingredient_ids(self):
+		return self._ingredient_ids
+
+	def _count(self, rng, unit):
+		if unit is None:
+			return str(rng.randint(1, 6))
+		elif unit in ("g", "ml"):
+			return str(rng.randrange(5, 500, 5))
+		else:
+			return rng.choice([ "1/2", "1", "1 1/2", "2", "3", "1/4" ])
+
+	def _step(self, rng, ingredient_ids, words):
+		parts = [ ]
+		for i in range(words):
+			choice = rng.random()
+			if choice < 0.15:
+				parts.append("<i>%s</i>" % (rng.choice(ingredient_ids)))
+			elif choice < 0.17:
+				parts.append("<temp>%d°C</temp>" % (rng.randrange(100, 250, 10)))
+			elif choice < 0.19:
+				parts.append("<time>%d Minuten</time>" % (rng.randint(1, 90)))
+			else:
+				parts.append(rng.choice(self._WORDS))
+		return " ".join(parts) + "."
+
+	def recipe(self, index, groups = 2, ingredients_per_group = 8, steps = 5, step_words = 40):
+		"""Returns the XML text of the synthetic recipe with the given
+		index."""
+		rng = random.Random("%d:%d" % (self._seed, index))
+		lines = [ "<?xml version=\"1.0\" encoding=\"utf-8\"?>" ]
+		lines.append("<recipe name=\"Synthetic recipe %d\" lang=\"de\">" % (index))
+		lines.append("\t<ingredients>")
+		used_ids = [ ]
+		for group in range(groups):
+			lines.append("\t\t<group%d name=\"Gruppe %d\">" % (group, group + 1))
+			for ingredient_id in rng.sample(self._ingredient_ids, min(ingredients_per_group, len(self._ingredient_ids))):
+				if (len(self._other_units) > 0) and (rng.random() < 0.1):
+					unit = rng.choice(self._other_units)
+				else:
+					unit = rng.choice(self._units[ingredient_id])
+				used_ids.append(ingredient_id)
+				if unit is None:
+					lines.append("\t\t\t<ingredient name=%s count=\"%s\" />" % (quoteattr(ingredient_id), self._count(rng, unit)))
+				else:
+					lines.append("\t\t\t<ingredient name=%s count=\"%s\" unit=%s />" % (quoteattr(ingredient_id), self._count(rng, unit), quoteattr(unit)))
+			lines.append("\t\t</group%d>" % (group))
+		lines.append("\t</ingredients>")
+		if len(self._serving_ids) > 0:
+			lines.append("\t<serves>")
+			lines.append("\t\t<option value=%s count=\"%d\" />" % (quoteattr(rng.choice(self._serving_ids)), rng.randint(1, 24)))
+			lines.append("\t</serves>")
+		lines.append("\t<preparation>")
+		for step in range(steps):
+			lines.append("\t\t<step>")
+			lines.append("\t\t\t" + self._step(rng, used_ids or self._ingredient_ids, step_words))
+			lines.append("\t\t</step>")
+		lines.append("\t</preparation>")
+		lines.append("</recipe>")
+		return "\n".join(lines) + "\n"
+
+	def generate(self, count, **kwargs):
+		"""Yields (name, XML text) tuples of 'count' synthetic recipes."""
+		for index in range(count):
+			yield ("synthetic%05d" % (index), self.recipe(index, **kwargs))
+
+	def write(self, directory, count, **kwargs):
+		os.makedirs(directory, exist_ok = True)
+		for (name, xml_text) in self.generate(count, **kwargs):
+			with open(directory + "/" + name + ".xml", "w") as f:
+				f.write(xml_text)
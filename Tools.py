@@ -19,23 +19,51 @@
 #
 #	Johannes Bauer <JohannesBauer@gmx.de>
 
-import re
+import os
+import json
+import contextlib
+from Quantity import Quantity
 
 class Tools():
-	_SIMPLE_FRACTION_RE = re.compile("(?P<numerator>\d+)\s*/\s*(?P<denominator>\d+)")
-	_WHOLE_SIMPLE_FRACTION_RE = re.compile("(?P<whole>\d+)\s+(?P<numerator>\d+)\s*/\s*(?P<denominator>\d+)")
+	@staticmethod
+	def str2float(text):
+		"""Returns the value of a quantity as a float, see Quantity.parse()."""
+		return Quantity.parse(text).value
 
-	@classmethod
-	def str2float(cls, text):
-		text = text.strip()
-		match = cls._WHOLE_SIMPLE_FRACTION_RE.fullmatch(text)
-		if match:
-			match = match.groupdict()
-			return int(match["whole"]) + (int(match["numerator"]) / int(match["denominator"]))
+	@staticmethod
+	def str2float_or_none(text):
+		"""Like str2float(), but returns None for text that is not a quantity,
+		e.g. a free-form serving count."""
+		try:
+			return Tools.str2float(text)
+		except ValueError:
+			return None
 
-		match = cls._SIMPLE_FRACTION_RE.fullmatch(text)
-		if match:
-			match = match.groupdict()
-			return int(match["numerator"]) / int(match["denominator"])
+	@staticmethod
+	def quantity2str(value):
+		"""Returns the display string of a quantity, which is a float or, in
+		exact mode, a Fraction."""
+		return str(float(value))
 
-		return float(text)
+	@staticmethod
+	@contextlib.contextmanager
+	def atomic_write(filename, binary = False):
+		"""Opens a temporary file next to the given file for writing text (or
+		bytes) and renames it to the given filename once the block completes
+		without error, so that readers only ever see the old or the complete
+		new file. On error, the temporary file is removed."""
+		tmp_filename = "%s.%d.tmp" % (filename, os.getpid())
+		fd = os.open(tmp_filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+		try:
+			with open(fd, "wb" if binary else "w") as f:
+				yield f
+			os.replace(tmp_filename, filename)
+		except BaseException:
+			os.unlink(tmp_filename)
+			raise
+
+	@staticmethod
+	def json_script(data):
+		"""Serializes data as JSON so that it can be embedded in a <script>
+		element of a page."""
+		return json.dumps(data, ensure_ascii = False, separators = (",", ":")).replace("</", "<\\/")
@@ -19,15 +19,31 @@
 #
 #	Johannes Bauer <JohannesBauer@gmx.de>
 
+from Quantity import Quantity
+
 class UnknownUnitException(Exception): pass
 
 class UnitConversion():
-	def __init__(self, conversion_dict):
-		self._dict = dict(conversion_dict)
+	def __init__(self, conversion_dict, exact = False):
+		if exact:
+			self._dict = { unit: Quantity.rational(scalar) for (unit, scalar) in conversion_dict.items() }
+		else:
+			self._dict = dict(conversion_dict)
 
 	def is_known(self, unit):
 		return unit in self._dict
 
+	@property
+	def units(self):
+		return self._dict.keys()
+
+	def factor(self, from_unit, to_unit):
+		"""Returns the factor by which a value in from_unit needs to be
+		multiplied to obtain the value in to_unit."""
+		if from_unit == to_unit:
+			return 1
+		return self(1, from_unit, to_unit)
+
 	def __call__(self, value, from_unit, to_unit):
 		if from_unit == to_unit:
 			return value
@@ -23,7 +23,9 @@
 #
 #	File UUID d93f813c-5df5-489a-8f18-ada965493642
 
+import sys
 import xml.parsers.expat
+from Instrumentation import Instrumentation
 
 class XMLException(Exception):
 	def __init__(self, text):
@@ -34,27 +36,30 @@ class XMLNode():
 	easily accessing XML/HTML in a "pythonic" manner. Don't expect this
 	implementation to understand all XML features."""
 
+	__slots__ = ("_name", "_parent", "_linenumber", "_attrs", "_children", "_index")
+
 	CDATA_NODENAME = "#cdata"
 	CDATA_ATTRIBUTE = "text"
 
 	def __init__(self, name, attrs = None, parent = None, linenumber = None):
 		"""Creates a node with a specific name. May be initialized with a
 		attribute dictionary (or None if no attributes are given) and a parent
-		node (or None if root node)."""
+		node (or None if root node). Node and attribute names are interned, so
+		that a large tree only holds one copy of every name."""
 		assert(isinstance(name, str))
 		assert((linenumber is None) or isinstance(linenumber, int))
 		if attrs is None:
 			attrs = { }
 		else:
 			# Create a copy of the attribute dictionary
-			attrs = dict(attrs)
+			attrs = { sys.intern(key): value for (key, value) in attrs.items() }
 
-		self._name = name
+		self._name = sys.intern(name)
 		self._parent = parent
 		self._linenumber = linenumber
 		self._attrs = attrs
 		self._children = [ ]
-		self._cdata = ""
+		self._index = None
 
 	def getname(self):
 		"""Returns the name of the current node."""
@@ -115,8 +120,22 @@ class XMLNode():
 			node = XMLNode(node, kwargs)
 		assert(isinstance(node, XMLNode))
 		self._children.append(node)
+		if self._index is not None:
+			self._index.setdefault(node._name, [ ]).append(node)
 		return node
-	
+
+	def _getindex(self):
+		"""Returns a dictionary that maps node names to the list of children
+		with that name (in document order). It is built on first use and kept
+		up to date by addchild(), so that lookup by name and position does not
+		need to scan all children."""
+		if self._index is None:
+			index = { }
+			for child in self._children:
+				index.setdefault(child._name, [ ]).append(child)
+			self._index = index
+		return self._index
+
 	def getallchildren(self):
 		"""Return an iterator over all children."""
 		return iter(self._children)
@@ -124,7 +143,11 @@ class XMLNode():
 	def getchildren(self, nodename, **attrs):
 		"""Return an iterator over all children that have the specified
 		nodename and satisfy all kwargs conditions for attributes."""
-		for child in self._children:
+		if nodename is None:
+			candidates = self._children
+		else:
+			candidates = self._getindex().get(nodename, ())
+		for child in candidates:
 			if child._nodematch(nodename, **attrs):
 				yield child
 
@@ -132,6 +155,9 @@ class XMLNode():
 		"""Return the first child that has the specified nodename and satisfies
 		all kwargs conditions for attributes. Returns 'None' if no child was
 		found."""
+		if (nodename is not None) and (len(attrs) == 0):
+			children = self._getindex().get(nodename)
+			return children[0] if children else None
 		for node in self.getchildren(nodename, **attrs):
 			return node
 		return None
@@ -275,12 +301,7 @@ class XMLNode():
 		if isinstance(key, str):
 			result = self._attrs[key]
 		else:
-			cnt = 0
-			for partialresult in self._parent.getchildren(self.getname()):
-				if cnt == key:
-					result = partialresult
-					break
-				cnt += 1
+			result = self._parent._getindex()[self._name][key]
 		return result
 	
 	def get(self, key, defaultvalue = None):
@@ -296,6 +317,10 @@ class XMLNode():
 	def __getattr__(self, attribute):
 		"""Returns the first child node with the appropriate name. Shortcut for
 		getchild(), but throws an exception if no such child is found."""
+		if attribute.startswith("_"):
+			# Never treat private or special attributes (e.g. unset slots or
+			# special methods looked up by copy/pickle) as child nodes
+			raise AttributeError(attribute)
 		child = self.getchild(attribute)
 		if child is None:
 			raise XMLException("Node has no child node called '%s'." % (attribute))
@@ -396,16 +421,34 @@ class XMLNode():
 class XMLParser():
 	"""Parses an XML document using expat and returns a DOM representation with
 	a XMLNode root node."""
-	def __init__(self):
+	def __init__(self, strip_whitespace = False):
+		"""Creates a parser. If strip_whitespace is set, cdata nodes which
+		consist of whitespace only (such as indentation between elements) are
+		not added to the tree. Note that this also drops significant
+		whitespace between two inline elements."""
 		self._rootnode = None
 		self._curnode = None
+		self._strip_whitespace = strip_whitespace
+		self._cdata = [ ]
 
 		self._parser = xml.parsers.expat.ParserCreate()			
 		self._parser.StartElementHandler = self._startElementHandler
 		self._parser.EndElementHandler = self._endElementHandler
 		self._parser.CharacterDataHandler = self._cDataHandler
 
+	def _flushcdata(self):
+		"""Expat reports cdata in many small chunks (e.g. one per line). They
+		are collected and only joined and appended to the current node once
+		the run of cdata is complete, i.e., when the next tag starts or
+		ends."""
+		if len(self._cdata) > 0:
+			cdata = "".join(self._cdata)
+			self._cdata = [ ]
+			if (not self._strip_whitespace) or (not cdata.isspace()):
+				self._curnode.appendcdata(cdata)
+
 	def _startElementHandler(self, nodename, nodeattrs):
+		self._flushcdata()
 		newNode = XMLNode(nodename, nodeattrs, self._curnode, self._parser.CurrentLineNumber)
 		if self._curnode is None:
 			# If rootnode, just set newnode to curnode
@@ -418,10 +461,11 @@ class XMLParser():
 	def _endElementHandler(self, nodename):
 		if nodename != self._curnode.getname():
 			raise XMLException("Invalid XML, expected </%s>, but encountered </%s>." % (self._curnode.getname(), nodename))
+		self._flushcdata()
 		self._curnode = self._curnode.getparent()
 
 	def _cDataHandler(self, cdata):
-		self._curnode.appendcdata(cdata)
+		self._cdata.append(cdata)
 	
 	def parsehandle(self, filehdl):
 		"""Parse the given file handle, which has to be opened in binary mode
@@ -429,9 +473,11 @@ class XMLParser():
 		self._parser.ParseFile(filehdl)
 		return self._rootnode
 
+	@Instrumentation.timed("xml.parsefile", label = lambda self, filename: filename)
 	def parsefile(self, filename):
 		"""Parse the given XML file and return the root node."""
-		return self.parsehandle(open(filename, "rb"))
+		with open(filename, "rb") as f:
+			return self.parsehandle(f)
 	
 	def parse(self, xmltext):
 		"""Parse the given XML text and return the root node."""
@@ -529,6 +575,15 @@ if __name__ == "__main__":
 		assert(tree.someitem[2].otheritem[1]["id"] == "subindex1")
 		assert(tree.someitem[2].otheritem[2]["id"] == "subindex2")
 		assert(tree.someitem[2].otheritem[3]["id"] == "subindex3")
+		assert(tree.someitem[-1]["id"] == "index3")
+
+		# Children added after the index has been built must be found
+		tree.addchild("someitem", id = "index4")
+		tree.addchild("newitem", id = "new0")
+		assert(tree.someitem[4]["id"] == "index4")
+		assert(tree.newitem["id"] == "new0")
+		assert(len(list(tree.someitem)) == 5)
+		assert(tree.getchild("someitem", id = "index4") is tree.someitem[4])
 
 	def testcase4():
 		xmltest = """<?xml version="1.0" encoding="UTF-8"?>
@@ -537,11 +592,33 @@ if __name__ == "__main__":
 		tree = XMLParser().parse(xmltest)
 		print(tree.getcdata(spacers = True))
 
+	def testcase5():
+		xmltest = """<?xml version="1.0" encoding="UTF-8"?>
+			<xmldefinition>
+				<someitem foo="1.0" />
+				<otheritem>  <a>x</a> <b>y</b>  </otheritem>
+			</xmldefinition>
+		"""
+		tree = XMLParser(strip_whitespace = True).parse(xmltest)
+		assert([ child.getname() for child in tree.getallchildren() ] == [ "someitem", "otheritem" ])
+		assert([ child.getname() for child in tree.otheritem.getallchildren() ] == [ "a", "b" ])
+		assert(tree.someitem.getname() is sys.intern("someitem"))
+
+		tree = XMLParser().parse(xmltest)
+		assert(len(list(tree.getallchildren())) == 5)
+		assert(tree.otheritem.getcdata() == "  x y  ")
+		try:
+			tree._private
+			assert(False)
+		except AttributeError:
+			pass
+
 
 	testcase1()
 	testcase2()
 	testcase3()
 	testcase4()
+	testcase5()
 
 #	import os
 #	for (directory, subdirs, files) in os.walk("xmltest/"):
@@ -72,89 +72,115 @@ function value_to_text(value, do_round) {
 	return value;
 }
 
-function determine_singular_plural(node, value) {
-	if (node == null) {
-		return;
+function singular_or_plural(forms, text) {
+	if ((forms == null) || !forms[0] || !forms[1]) {
+		return null;
 	}
-	const singular = node.getAttribute("singular");
-	const plural = node.getAttribute("plural");
-	if (singular && plural) {
-		if (value == 1) {
-			node.innerHTML = singular;
-		} else {
-			node.innerHTML = plural;
+	return (text == 1) ? forms[0] : forms[1];
+}
+
+/* Scaling state of the page, set up once by initialize_recipe(). Quantity i
+ * of the embedded JSON data block belongs to the i-th .scaletext span. */
+const recipe_state = {
+	values: null,
+	units: null,
+	names: null,
+	nodes: null,
+	pending_update: false,
+};
+
+function scaletext_update() {
+	recipe_state.pending_update = false;
+	const nodes = recipe_state.nodes;
+	for (let i = 0; i < nodes.length; i++) {
+		const text = value_to_text(recipe_state.values[i], true);
+		nodes[i].scalar.textContent = text;
+		if (nodes[i].unit != null) {
+			const unit_text = singular_or_plural(recipe_state.units[i], text);
+			if (unit_text != null) {
+				nodes[i].unit.textContent = unit_text;
+			}
+		}
+		if (nodes[i].name != null) {
+			const name_text = singular_or_plural(recipe_state.names[i], text);
+			if (name_text != null) {
+				nodes[i].name.textContent = name_text;
+			}
 		}
 	}
 }
 
-function scaletext_scaleby(scaletext, scale_factor) {
-	const scalar = scaletext.querySelector(".scalar");
-
-	const new_value = scalar.getAttribute("value") * scale_factor;
-	scalar.setAttribute("value", new_value);
-	scalar.innerHTML = value_to_text(new_value, true);
-
-	const unit = scaletext.querySelector(".unit");
-	const name = scaletext.querySelector(".name");
-	determine_singular_plural(unit, scalar.innerHTML);
-	determine_singular_plural(name, scalar.innerHTML);
+function scaletext_schedule_update() {
+	/* All DOM writes of one scaling happen in a single animation frame */
+	if (!recipe_state.pending_update) {
+		recipe_state.pending_update = true;
+		window.requestAnimationFrame(scaletext_update);
+	}
 }
 
-function scaletext_callback(scaletext) {
-	const scalar = scaletext.querySelector(".scalar");
+function scaletext_scaleby(scale_factor) {
+	const values = recipe_state.values;
+	for (let i = 0; i < values.length; i++) {
+		values[i] *= scale_factor;
+	}
+	scaletext_schedule_update();
+}
 
-	const old_value = scalar.getAttribute("value") * 1.0;
+function scaletext_callback(index) {
+	const old_value = recipe_state.values[index];
 	const new_value_text = prompt("Enter new value", value_to_text(old_value, false));
 	if ((new_value_text == null) || (new_value_text <= 0)) {
 		return;
 	}
 	const new_value = text_to_value(new_value_text);
-	const scale_factor = new_value / old_value;
-
-	document.querySelectorAll(".scaletext").forEach(function(node) {
-		scaletext_scaleby(node, scale_factor);
-	});
-}
-
-function scaletext_event_callback(event) {
-	/* We get the event that we registered for scaletext, but the target can be
-	 * one of the subordinate <span>s. Therefore, we search the event path for
-	 * the right parent. */
-	for (let element of event.path) {
-		if (element.classList.contains("scaletext")) {
-			/* Got the right element */
-			scaletext_callback(element);
-			return;
-		}
-	}
+	scaletext_scaleby(new_value / old_value);
 }
 
-function option_checkbox_callback(event) {
-	const ck_showoriginal = document.getElementById("ck_showoriginal");
-	const ck_showalt = document.getElementById("ck_showalt");
-	const ck_showshoppinglist = document.getElementById("ck_showshoppinglist");
+function option_checkbox_callback(options) {
+	const ck_showoriginal = options.ck_showoriginal.checked;
+	const ck_showalt = options.ck_showalt.checked;
+	const ck_showshoppinglist = options.ck_showshoppinglist.checked;
 
-	document.querySelectorAll("div.ingredient.original").forEach(function(node) {
-		node.style.display = ck_showoriginal.checked ? "" : "none";
-	});
-	document.querySelectorAll("div.ingredient.alt").forEach(function(node) {
-		node.style.display = ck_showalt.checked ? "" : "none";
-	});
-	document.getElementById("shoppinglist").style.display = ck_showshoppinglist.checked ? "" : "none";
+	for (const node of options.original) {
+		node.style.display = ck_showoriginal ? "" : "none";
+	}
+	for (const node of options.alt) {
+		node.style.display = ck_showalt ? "" : "none";
+	}
+	options.shoppinglist.style.display = ck_showshoppinglist ? "" : "none";
 }
 
 function initialize_recipe() {
-	document.querySelectorAll(".scalar").forEach(function(node) {
-		node.setAttribute("value", text_to_value(node.innerHTML));
-	});
-	document.querySelectorAll(".scaletext").forEach(function(node) {
-		scaletext_scaleby(node, 1.0);
-		node.onclick = scaletext_event_callback;
+	const quantities = JSON.parse(document.getElementById("quantities").textContent);
+	recipe_state.values = Float64Array.from(quantities.values);
+	recipe_state.units = quantities.units;
+	recipe_state.names = quantities.names;
+	recipe_state.nodes = Array.from(document.querySelectorAll(".scaletext"), function(node, index) {
+		node.onclick = function() {
+			scaletext_callback(index);
+		};
+		return {
+			scalar: node.querySelector(".scalar"),
+			unit: node.querySelector(".unit"),
+			name: node.querySelector(".name"),
+		};
 	});
+	scaletext_update();
+
+	const options = {
+		ck_showoriginal: document.getElementById("ck_showoriginal"),
+		ck_showalt: document.getElementById("ck_showalt"),
+		ck_showshoppinglist: document.getElementById("ck_showshoppinglist"),
+		original: Array.from(document.querySelectorAll("div.ingredient.original")),
+		alt: Array.from(document.querySelectorAll("div.ingredient.alt")),
+		shoppinglist: document.getElementById("shoppinglist"),
+	};
 	document.querySelectorAll(".option_checkbox").forEach(function(node) {
-		node.onclick = option_checkbox_callback;
+		node.onclick = function() {
+			option_checkbox_callback(options);
+		};
 	});
-	option_checkbox_callback(null);
+	option_checkbox_callback(options);
 	document.querySelectorAll(".centerblock").forEach(function(node) {
 		node.style = "";
 	});
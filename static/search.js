@@ -0,0 +1,63 @@
+/*
+	recipes - Python-based HTML5 generation for cooking recipes
+	Copyright (C) 2019-2019 Johannes Bauer
+
+	This file is part of recipes.
+
+	recipes is free software; you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation; this program is ONLY licensed under
+	version 3 of the License, later versions are explicitly excluded.
+
+	recipes is distributed in the hope that it will be useful,
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+
+	You should have received a copy of the GNU General Public License
+	along with recipes; if not, write to the Free Software
+	Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+	Johannes Bauer <JohannesBauer@gmx.de>
+*/
+
+function search_build_haystacks(index) {
+	/* One lowercase search text per recipe: page name, recipe name, the IDs
+	 * and localized names of all ingredients and the kinds of servings. */
+	return index.recipes.map(function(recipe) {
+		const [ page_name, name, ingredients, serves ] = recipe;
+		const parts = [ page_name, name ];
+		for (const ingredient_index of ingredients) {
+			parts.push(index.ingredients[ingredient_index][0]);
+			parts.push(index.ingredients[ingredient_index][1]);
+		}
+		for (const [ count, serving_name ] of serves) {
+			parts.push(serving_name);
+		}
+		return parts.join("\n").toLowerCase();
+	});
+}
+
+function search_filter(input, nodes, haystacks) {
+	const terms = input.value.toLowerCase().split(/\s+/).filter(term => term.length > 0);
+	for (let i = 0; i < nodes.length; i++) {
+		const match = terms.every(term => haystacks[i].includes(term));
+		nodes[i].style.display = match ? "" : "none";
+	}
+}
+
+function initialize_search(index_url) {
+	const input = document.getElementById("search");
+	const nodes = Array.from(document.querySelectorAll("#recipes .recipe"));
+	fetch(index_url).then(response => response.json()).then(function(index) {
+		const haystacks = search_build_haystacks(index);
+		if (haystacks.length != nodes.length) {
+			return;
+		}
+		input.oninput = function() {
+			search_filter(input, nodes, haystacks);
+		};
+		input.style.display = "";
+		search_filter(input, nodes, haystacks);
+	});
+}